@@ -0,0 +1,88 @@
+# ai_worker.py - run search.Searcher in a worker process so the pygame loop never blocks
+#
+# The position goes to the worker as Board.snapshot(); the answer comes back as packed move codes.
+# Cancelling bumps a shared generation counter: the worker's stop() callback sees it within
+# ~1000 nodes, and any answer from an older generation is dropped.
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from engine import Board
+from search import Searcher, SearchResult
+from parallel_search import ParallelSearcher
+from tablebase import Tablebases
+
+# --- worker process side ---
+_generation = None
+_searcher = None
+
+def _init_worker(generation, workers):
+    global _generation, _searcher
+    _generation = generation
+    # kept between moves so the transposition table carries over
+    tablebases = Tablebases()
+    if not tablebases.available(): tablebases = None
+    _searcher = ParallelSearcher(workers, tablebases=tablebases) if workers > 1 else Searcher(tablebases=tablebases)
+
+def _search_job(snapshot, generation, time_limit, max_depth):
+    board = Board.from_snapshot(snapshot)
+    stop = lambda: _generation.value != generation
+    r = _searcher.search(board, max_depth=max_depth, time_limit=time_limit, stop=stop)
+    return (generation, r.move.code if r.move else None, r.score, r.depth, r.nodes, r.elapsed, [m.code for m in r.pv])
+
+def _close_worker():
+    # let a parallel searcher stop its own helper processes before the worker exits
+    if isinstance(_searcher, ParallelSearcher): _searcher.close()
+
+# --- UI side ---
+# spawn, not fork: the parent holds SDL/pygame state that a forked child must not inherit
+_mp = multiprocessing.get_context('spawn')
+
+class BackgroundSearch:
+    def __init__(self, workers=1):
+        # workers > 1: the background process runs a Lazy SMP search (parallel_search) with that many processes
+        self.workers = workers
+        self._generation = _mp.Value('i', 0)
+        self._executor = None
+        self._future = None
+        self._hash = None
+
+    @property
+    def busy(self):
+        return self._future is not None
+
+    def start(self, board, time_limit, max_depth=64):
+        # Search board's position in the background; poll() returns the result later
+        self.cancel()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=_mp, initializer=_init_worker,
+                                                 initargs=(self._generation, self.workers))
+        self._hash = board.hash
+        self._future = self._executor.submit(_search_job, board.snapshot(), self._generation.value,
+                                             time_limit, max_depth)
+
+    def poll(self, board):
+        # SearchResult once the search is done and board is still at the searched position, else None
+        if self._future is None or not self._future.done(): return None
+        generation, code, score, depth, nodes, elapsed, pv = self._future.result()
+        self._future = None
+        if generation != self._generation.value or board.hash != self._hash or code is None: return None
+        # decode the PV along the line so each Move sees its own position
+        pv_moves = []
+        for c in pv:
+            pv_moves.append(board.decode_move(c))
+            board.make_code(c)
+        for _ in pv: board.unmake_code()
+        return SearchResult(board.decode_move(code), score, depth, nodes, pv_moves, elapsed)
+
+    def cancel(self):
+        # Stop the running search (Undo / New Game); its answer will be ignored
+        if self._future is not None:
+            with self._generation.get_lock():
+                self._generation.value += 1
+            self._future = None
+
+    def shutdown(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.submit(_close_worker)
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,162 @@
+# batch_eval.py - evaluate many positions at once with NumPy
+#
+# Positions become an (N, 12) uint64 array of Board.bitboards (engine.PIECES order) and, for the
+# table terms, a (N, 12, 64) 0/1 array of planes (square r*8+c); material, piece-square and mobility
+# terms are then computed for the whole batch with array operations. With mobility_weight=0 the
+# scores are exactly evaluation.evaluate's.
+#
+#   python batch_eval.py -n 20000        # benchmark against the scalar path on self-play positions
+#
+# Needs NumPy (pip install numpy). It is optional: nothing else in the project imports this module.
+import argparse
+import random
+import time
+import numpy as np
+from engine import Board, PIECES, WHITE, KNIGHT_ATTACKS, bishop_attacks, rook_attacks, iter_bits
+from evaluation import evaluate, PIECE_VALUES, PIECE_SQUARE, KING_ENDGAME_SQUARE, ENDGAME_MATERIAL
+
+# per plane: value + table bonus, signed for the owner (kings are handled separately)
+PSQ = np.array([[0] * 64 if p in 'Kk' else PIECE_SQUARE[p] if p.isupper() else [-v for v in PIECE_SQUARE[p]]
+                for p in PIECES], dtype=np.int32)
+KING_MIDDLE = np.array([PIECE_SQUARE['K'], [-v for v in PIECE_SQUARE['k']]], dtype=np.int32)
+KING_END = np.array([KING_ENDGAME_SQUARE['K'], [-v for v in KING_ENDGAME_SQUARE['k']]], dtype=np.int32)
+# non-pawn, non-king material per plane, for the endgame king switch
+HEAVY = np.array([0 if p in 'PpKk' else PIECE_VALUES[p.lower()] for p in PIECES], dtype=np.int32)
+WHITE_PLANES = [PIECES.index(p) for p in 'PNBRQK']
+BLACK_PLANES = [PIECES.index(p) for p in 'pnbrqk']
+
+# Mobility works on the bitboards themselves, one uint64 per position: a step (dr, dc) is a shift by
+# dr*8+dc, masking the files a piece can't have come from so nothing wraps around the board edge.
+_FILE = [sum(1 << (r*8 + c) for r in range(8)) for c in range(8)]
+def _step_mask(dc):
+    # squares a piece may step from in column direction dc
+    return np.uint64(0xFFFFFFFFFFFFFFFF & ~sum(_FILE[c] for c in range(8) if not 0 <= c + dc < 8))
+def _steps(dirs):
+    return [(dr*8 + dc, _step_mask(dc)) for dr, dc in dirs]
+KNIGHT_STEPS = _steps([(-2,-1), (-2,1), (-1,-2), (-1,2), (1,-2), (1,2), (2,-1), (2,1)])
+BISHOP_STEPS = _steps([(-1,-1), (-1,1), (1,-1), (1,1)])
+ROOK_STEPS = _steps([(-1,0), (1,0), (0,-1), (0,1)])
+SLIDER_STEPS = [BISHOP_STEPS, ROOK_STEPS, BISHOP_STEPS + ROOK_STEPS]   # for B, R, Q
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.int32)
+
+def encode(boards):
+    # (bitboards uint64 (N, 12) in engine.PIECES order, side to move int32 (N,): +1 White, -1 Black)
+    bitboards = np.fromiter((b.bitboards[p] for b in boards for p in PIECES), dtype=np.uint64,
+                            count=len(boards) * 12).reshape(-1, 12)
+    stm = np.fromiter((1 if b.turn == WHITE else -1 for b in boards), dtype=np.int32, count=len(boards))
+    return bitboards, stm
+
+def to_planes(bitboards):
+    # (N, 12) bitboards -> (N, 12, 64) uint8 array with a 1 on every occupied square
+    return np.unpackbits(bitboards.astype('<u8').view(np.uint8).reshape(-1, 12, 8), axis=2, bitorder='little')
+
+def _shift(bb, step, mask):
+    bb = bb & mask
+    return bb << np.uint64(step) if step > 0 else bb >> np.uint64(-step)
+
+def _popcount(bb):
+    if hasattr(np, 'bitwise_count'): return np.bitwise_count(bb)   # NumPy >= 2.0
+    return POPCOUNT8[np.ascontiguousarray(bb).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _mobility(bitboards, own, empty, letters):
+    # squares attacked by the knights and sliders of one side that don't hold one of its own pieces;
+    # pieces of one kind never reach the same square along the same direction, so each direction's
+    # squares can be gathered into one set and counted once
+    not_own = ~own
+    knights = bitboards[:, PIECES.index(letters[0])]
+    total = np.zeros(len(bitboards), dtype=np.int32)
+    if knights.any():
+        for step, mask in KNIGHT_STEPS:
+            total += _popcount(_shift(knights, step, mask) & not_own)
+    for steps, letter in zip(SLIDER_STEPS, letters[1:]):
+        pieces = bitboards[:, PIECES.index(letter)]
+        if not pieces.any(): continue
+        for step, mask in steps:
+            ray = pieces
+            reached = np.zeros_like(pieces)
+            for _ in range(7):
+                ray = _shift(ray, step, mask)
+                reached |= ray
+                ray = ray & empty
+                if not ray.any(): break
+            total += _popcount(reached & not_own)
+    return total
+
+def features(bitboards):
+    # Per-position terms from White's point of view: dict of (N,) int arrays
+    planes = to_planes(bitboards)
+    counts = planes.sum(axis=2, dtype=np.int32)
+    values = np.array([PIECE_VALUES[p] for p in 'pnbrq'], dtype=np.int32)
+    material = counts[:, :5] @ values - counts[:, 6:11] @ values
+    psq = np.einsum('npq,pq->n', planes, PSQ, dtype=np.int32)
+    kings = planes[:, [PIECES.index('K'), PIECES.index('k')]]
+    endgame = counts @ HEAVY <= ENDGAME_MATERIAL
+    king = np.where(endgame, np.einsum('npq,pq->n', kings, KING_END, dtype=np.int32),
+                    np.einsum('npq,pq->n', kings, KING_MIDDLE, dtype=np.int32))
+    white = np.bitwise_or.reduce(bitboards[:, WHITE_PLANES], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, BLACK_PLANES], axis=1)
+    empty = ~(white | black)
+    mobility = _mobility(bitboards, white, empty, 'NBRQ') - _mobility(bitboards, black, empty, 'nbrq')
+    # psq already contains the material
+    return {'material': material, 'pst': psq + king - material, 'mobility': mobility}
+
+def evaluate_batch(boards, mobility_weight=0):
+    # Scores in centipawns from each side to move's point of view, as an (N,) int array
+    bitboards, stm = encode(boards)
+    f = features(bitboards)
+    return (f['material'] + f['pst'] + mobility_weight * f['mobility']) * stm
+
+def mobility(board):
+    # scalar version of the mobility feature (White minus Black)
+    occ = board.occupancy[WHITE] | board.occupancy['b']
+    score = 0
+    for letters, own, sign in (('NBRQ', board.occupancy[WHITE], 1), ('nbrq', board.occupancy['b'], -1)):
+        n, b, r, q = (board.bitboards[p] for p in letters)
+        for sq in iter_bits(n): score += sign * bin(KNIGHT_ATTACKS[sq] & ~own).count('1')
+        for sq in iter_bits(b | q): score += sign * bin(bishop_attacks(sq, occ) & ~own).count('1')
+        for sq in iter_bits(r | q): score += sign * bin(rook_attacks(sq, occ) & ~own).count('1')
+    return score
+
+def sample_positions(n, seed=0, max_plies=120):
+    # positions from random games, each a fresh Board
+    rng = random.Random(seed)
+    boards = []
+    board = Board()
+    while len(boards) < n:
+        if board.game_status() is not None or len(board.move_stack) >= max_plies:
+            board = Board()
+        board.apply_move(rng.choice(board.get_valid_moves()))
+        boards.append(board.clone(history=False))
+    return boards
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batch evaluation against evaluation.evaluate")
+    parser.add_argument('-n', '--positions', type=int, default=20000)
+    parser.add_argument('--mobility', type=int, default=4, help="mobility weight for the timed comparison")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    boards = sample_positions(args.positions, args.seed)
+    stm = [1 if b.turn == WHITE else -1 for b in boards]
+
+    t0 = time.perf_counter()
+    scalar = [evaluate(b) + args.mobility * mobility(b) * s for b, s in zip(boards, stm)]
+    t_scalar = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = evaluate_batch(boards, args.mobility)
+    t_batch = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    encode(boards)
+    t_encode = time.perf_counter() - t0
+
+    assert (batch == np.array(scalar)).all(), "batch and scalar scores differ"
+    assert (evaluate_batch(boards) == np.array([evaluate(b) for b in boards])).all()
+    n = len(boards)
+    print(f"{n} positions, scores match")
+    print(f"scalar: {t_scalar:.3f}s ({n / t_scalar:,.0f} pos/s)")
+    print(f"batch:  {t_batch:.3f}s ({n / t_batch:,.0f} pos/s) of which encoding {t_encode:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# book.py - opening book: sorted binary file of (position hash, move, weight), memory-mapped
+#
+#   python book.py build selfplay_games.jsonl -o book.bin --plies 16
+#   python book.py probe book.bin [--fen FEN]
+#
+# File layout: 8-byte magic, then 12-byte little-endian entries <hash:u64><move:u16><weight:u16>
+# sorted by (hash, move). Probing is a binary search straight on the mmap, so opening a book
+# costs the same however big it is.
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+from collections import defaultdict
+from engine import Board
+
+MAGIC = b'CHSBOOK1'
+ENTRY = struct.Struct('<QHH')
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) or (size - len(MAGIC)) % ENTRY.size:
+            self._file.close()
+            raise ValueError(f"{path}: not an opening book")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not an opening book")
+        self.count = (size - len(MAGIC)) // ENTRY.size
+
+    @classmethod
+    def open_if_exists(cls, path):
+        return cls(path) if os.path.exists(path) else None
+
+    def _key(self, i):
+        return struct.unpack_from('<Q', self._mm, len(MAGIC) + i * ENTRY.size)[0]
+
+    def probe(self, key):
+        # [(packed move, weight)] stored for a position hash
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key: lo = mid + 1
+            else: hi = mid
+        entries = []
+        while lo < self.count:
+            h, move, weight = ENTRY.unpack_from(self._mm, len(MAGIC) + lo * ENTRY.size)
+            if h != key: break
+            entries.append((move, weight))
+            lo += 1
+        return entries
+
+    def choose(self, board, rng=random):
+        # weighted random book Move for board, or None when out of book
+        legal = set(board.legal_codes())
+        entries = [(m, w) for m, w in self.probe(board.hash) if m in legal and w > 0]
+        if not entries: return None
+        pick = rng.randrange(sum(w for _, w in entries))
+        for move, weight in entries:
+            pick -= weight
+            if pick < 0: return board.decode_move(move)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_book(counts, out_path):
+    # counts: {(hash, packed move): weight}
+    with open(out_path, 'wb') as out:
+        out.write(MAGIC)
+        for (h, move), weight in sorted(counts.items()):
+            out.write(ENTRY.pack(h, move, min(weight, 0xFFFF)))
+
+def build_book(game_paths, out_path, max_plies=16, min_weight=2):
+    # Replay recorded games (selfplay.py JSON lines) and weight each (position, move) by results:
+    # 2 for the winner's moves, 1 for a draw, 0 for the loser's. The random opening plies a record
+    # lists in 'random_plies' are played over but not added to the book.
+    counts = defaultdict(int)
+    games = 0
+    for path in game_paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip(): continue
+                record = json.loads(line)
+                board = Board()
+                skip = record.get('random_plies', 0)
+                for ply, text in enumerate(record['moves'][:max_plies]):
+                    move = board.move_from_uci(text)
+                    if move is None: break
+                    if ply < skip:
+                        board.apply_move(move)
+                        continue
+                    mover_won = record['result'] == ('1-0' if board.turn == 'w' else '0-1')
+                    weight = 1 if record['result'] == '1/2-1/2' else 2 if mover_won else 0
+                    counts[(board.hash, move.code)] += weight
+                    board.apply_move(move)
+                games += 1
+    kept = {k: w for k, w in counts.items() if w >= min_weight}
+    write_book(kept, out_path)
+    return games, len(kept)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe the opening book")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="build a book from recorded games")
+    build.add_argument('games', nargs='+', help="selfplay.py JSON lines files")
+    build.add_argument('-o', '--output', default='book.bin')
+    build.add_argument('--plies', type=int, default=16, help="only use the first N plies of each game")
+    build.add_argument('--min-weight', type=int, default=2, help="drop moves with a smaller total weight")
+    probe = sub.add_parser('probe', help="list book moves for a position")
+    probe.add_argument('book')
+    probe.add_argument('--fen')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        games, entries = build_book(args.games, args.output, args.plies, args.min_weight)
+        print(f"{args.output}: {entries} entries from {games} games")
+    else:
+        board = Board(args.fen) if args.fen else Board()
+        with OpeningBook(args.book) as book:
+            for move, weight in sorted(book.probe(board.hash), key=lambda e: -e[1]):
+                print(f"{board.decode_move(move).uci()} {weight}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # chess_engine_full.py
-import copy
+import random
+from evaluation import PIECE_VALUES, PIECE_SQUARE
 
 WHITE = 'w'
 BLACK = 'b'
@@ -9,10 +10,170 @@ DIRS_BISHOP = [(-1,-1),(-1,1),(1,-1),(1,1)]
 DIRS_ROOK = [(-1,0),(1,0),(0,-1),(0,1)]
 DIRS_KING = DIRS_BISHOP + DIRS_ROOK
 
+PIECES = 'PNBRQKpnbrqk'
+COLOR_PIECES = {WHITE: 'PNBRQK', BLACK: 'pnbrqk'}
+
 def in_bounds(r,c):
     return 0 <= r < 8 and 0 <= c < 8
 
+# --- Bitboards ---
+# Square index sq = r*8 + c, so bit 0 is a8 and bit 63 is h1 (same orientation as Board.board).
+SQUARE_RC = [(sq >> 3, sq & 7) for sq in range(64)]
+
+def sq_index(pos):
+    return pos[0]*8 + pos[1]
+
+def _step_table(dirs):
+    table = []
+    for sq in range(64):
+        r0,c0 = SQUARE_RC[sq]
+        bb = 0
+        for dr,dc in dirs:
+            if in_bounds(r0+dr,c0+dc):
+                bb |= 1 << ((r0+dr)*8 + c0+dc)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _step_table(DIRS_KNIGHT)
+KING_ATTACKS = _step_table(DIRS_KING)
+# Squares attacked by a pawn of the given colour standing on sq
+PAWN_ATTACKS = {WHITE: _step_table([(-1,-1),(-1,1)]), BLACK: _step_table([(1,-1),(1,1)])}
+
+def _ray_table(dr,dc):
+    table = []
+    for sq in range(64):
+        r,c = SQUARE_RC[sq]
+        bb = 0
+        r+=dr; c+=dc
+        while in_bounds(r,c):
+            bb |= 1 << (r*8+c)
+            r+=dr; c+=dc
+        table.append(bb)
+    return table
+
+# (ray table, ray runs towards higher square indices)
+BISHOP_RAYS = [(_ray_table(dr,dc), dr*8+dc > 0) for dr,dc in DIRS_BISHOP]
+ROOK_RAYS = [(_ray_table(dr,dc), dr*8+dc > 0) for dr,dc in DIRS_ROOK]
+
+def _slider_attacks(sq, occ, rays):
+    attacks = 0
+    for table,positive in rays:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            # cut the ray behind the nearest blocker
+            b = (blockers & -blockers).bit_length()-1 if positive else blockers.bit_length()-1
+            ray ^= table[b]
+        attacks |= ray
+    return attacks
+
+def _attack_table(rays):
+    # Per square: the relevant blocker mask (the rays minus their last square, which has nothing
+    # behind it) and {blockers: attacks} for every subset of it. Python's dict does the hashing a
+    # magic multiply would do in C, so a slider lookup is one mask and one dict index.
+    masks, tables = [], []
+    for sq in range(64):
+        mask = 0
+        for table,positive in rays:
+            ray = table[sq]
+            if ray: ray ^= 1 << (ray.bit_length()-1 if positive else (ray & -ray).bit_length()-1)
+            mask |= ray
+        attacks = {}
+        sub = 0
+        while True:   # every subset of mask (carry-rippler)
+            attacks[sub] = _slider_attacks(sq, sub, rays)
+            sub = (sub - mask) & mask
+            if not sub: break
+        masks.append(mask); tables.append(attacks)
+    return masks, tables
+
+BISHOP_MASK, BISHOP_TABLE = _attack_table(BISHOP_RAYS)
+ROOK_MASK, ROOK_TABLE = _attack_table(ROOK_RAYS)
+
+def bishop_attacks(sq, occ):
+    return BISHOP_TABLE[sq][occ & BISHOP_MASK[sq]]
+
+def rook_attacks(sq, occ):
+    return ROOK_TABLE[sq][occ & ROOK_MASK[sq]]
+
+ALL_SQUARES = (1 << 64) - 1
+# squares a pawn of each side promotes on (rank 8 is squares 0-7)
+PROMOTION_RANK = {WHITE: 0xFF, BLACK: 0xFF << 56}
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between a and b when they share a line, else 0
+    table = [[0]*64 for _ in range(64)]
+    for a in range(64):
+        for dr,dc in DIRS_KING:
+            r,c = SQUARE_RC[a]
+            path = 0
+            r+=dr; c+=dc
+            while in_bounds(r,c):
+                table[a][r*8+c] = path
+                path |= 1 << (r*8+c)
+                r+=dr; c+=dc
+    return table
+
+BETWEEN = _between_table()
+
+# --- Castling rights (bitmask) ---
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+CASTLING_NAMES = (('w_k',CASTLE_WK),('w_q',CASTLE_WQ),('b_k',CASTLE_BK),('b_q',CASTLE_BQ))
+# rights that survive a move touching sq (king or rook home squares)
+CASTLE_KEEP = [15]*64
+CASTLE_KEEP[60] = 15 & ~(CASTLE_WK|CASTLE_WQ); CASTLE_KEEP[63] = 15 & ~CASTLE_WK; CASTLE_KEEP[56] = 15 & ~CASTLE_WQ
+CASTLE_KEEP[4] = 15 & ~(CASTLE_BK|CASTLE_BQ); CASTLE_KEEP[7] = 15 & ~CASTLE_BK; CASTLE_KEEP[0] = 15 & ~CASTLE_BQ
+# king destination -> (rook from, rook to)
+CASTLE_ROOK = {62:(63,61), 58:(56,59), 6:(7,5), 2:(0,3)}
+
+# --- Packed moves ---
+# bits 0-5 from square, 6-11 to square, 12-14 promotion (index into PROMO_PIECES), bit 15 castling
+MOVE_CASTLE = 1 << 15
+PROMO_PIECES = {WHITE: '.NBRQ', BLACK: '.nbrq'}
+PROMO_INDEX = {'N':1,'B':2,'R':3,'Q':4,'n':1,'b':2,'r':3,'q':4}
+
+def encode_move(from_idx, to_idx, promotion=None, is_castling=False):
+    code = from_idx | to_idx << 6
+    if promotion: code |= PROMO_INDEX[promotion] << 12
+    if is_castling: code |= MOVE_CASTLE
+    return code
+
+def code_uci(code):
+    f = code & 63; t = code >> 6 & 63
+    promo = '.nbrq'[code >> 12 & 7] if code >> 12 & 7 else ''
+    return f"{chr((f&7)+97)}{8-(f>>3)}{chr((t&7)+97)}{8-(t>>3)}{promo}"
+
+# --- Zobrist keys ---
+# Fixed seed so a position hashes the same in every process (caches, books, worker pools).
+_zrng = random.Random(0x5EED)
+ZOBRIST_PIECES = {p: [_zrng.getrandbits(64) for _ in range(64)] for p in PIECES}
+_castle_keys = [_zrng.getrandbits(64) for _ in range(4)]
+ZOBRIST_BLACK = _zrng.getrandbits(64)
+# one key per combination of castling rights
+ZOBRIST_CASTLING = [0]*16
+for _rights in range(16):
+    for _i in range(4):
+        if _rights & (1 << _i): ZOBRIST_CASTLING[_rights] ^= _castle_keys[_i]
+del _zrng, _castle_keys
+
+# --- incremental evaluation terms ---
+# Material and value + piece-square bonus per piece letter, kept per colour by make/unmake.
+# Kings count 0 here: their table depends on the game phase, so evaluate adds them itself.
+PIECE_MATERIAL = {p: 0 if p in 'Kk' else PIECE_VALUES[p.lower()] for p in PIECES}
+EVAL_SQUARE = {p: [0]*64 if p in 'Kk' else PIECE_SQUARE[p] for p in PIECES}
+
+# undo record layout in Board._undo: code, captured piece, castling rights, halfmove clock, hash
+UNDO_SIZE = 5
+
+def iter_bits(bb):
+    while bb:
+        b = bb & -bb
+        yield b.bit_length()-1
+        bb ^= b
+
 class Move:
+    __slots__ = ('from_sq','to_sq','piece','captured','promotion','is_castling','_code','san')
+
     def __init__(self, from_sq, to_sq, piece, captured=None, promotion=None, is_castling=False):
         self.from_sq = from_sq
         self.to_sq = to_sq
@@ -20,6 +181,14 @@ class Move:
         self.captured = captured
         self.promotion = promotion
         self.is_castling = is_castling
+        self._code = None
+        self.san = None   # filled in by Board.apply_move(m, with_san=True)
+
+    @property
+    def code(self):
+        if self._code is None:
+            self._code = encode_move(sq_index(self.from_sq), sq_index(self.to_sq), self.promotion, self.is_castling)
+        return self._code
 
     def __repr__(self):
         fr = f"{chr(self.from_sq[1]+97)}{8-self.from_sq[0]}"
@@ -27,18 +196,177 @@ class Move:
         promo = f"={self.promotion}" if self.promotion else ""
         return f"{self.piece}{fr}->{to}{promo}"
 
+    def uci(self):
+        # coordinate notation, e.g. e2e4 / e7e8q
+        return code_uci(self.code)
+
 class Board:
-    def __init__(self):
+    # Set to True (on the class or an instance) to re-check the incremental hash after every make/unmake
+    debug_hash = False
+    # Set to True to cross-check get_valid_moves against the make/test/unmake generator
+    verify_movegen = False
+    # Set to True to re-check the incremental material / piece-square terms after every make/unmake
+    debug_eval = False
+
+    def __init__(self, fen=None):
         self.board = [['.' for _ in range(8)] for _ in range(8)]
         self.turn = WHITE
-        self.castling = {'w_k':True,'w_q':True,'b_k':True,'b_q':True}
+        self.castling_rights = 15
         self.move_stack = []
         self.halfmove_clock = 0
         self.fullmove_number = 1
-        self.init_board()
-
-    def clone(self):
-        return copy.deepcopy(self)
+        # bitboard core: one 64-bit set per piece letter plus occupancy per colour
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {WHITE:0, BLACK:0}
+        # per-colour piece lists {square: piece} and king squares, kept in step with make/unmake
+        self.piece_lists = {WHITE:{}, BLACK:{}}
+        self.king_sq = {WHITE:None, BLACK:None}
+        self.hash = 0
+        # running evaluation terms per colour (see EVAL_SQUARE), kept in step with make/unmake
+        self.material = {WHITE:0, BLACK:0}
+        self.psq = {WHITE:0, BLACK:0}
+        # undo records, UNDO_SIZE slots per ply, grown by doubling; _ply is the number in use
+        self._undo = [0] * (256 * UNDO_SIZE)
+        self._ply = 0
+        # hashes of positions played before the undo stack starts: None or (older, segment), immutable
+        # and shared between copies (see clone)
+        self._prior_hashes = None
+        # (hash, legal moves, moves by origin square, side to move in check, status) of the current position
+        self._cache = None
+        if fen is None: self.init_board()
+        else: self.set_fen(fen)
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(fen)
+
+    def set_fen(self, fen):
+        # Load a FEN position (the en passant field is accepted but ignored: the engine has no en passant)
+        parts = fen.split()
+        if len(parts) < 2 or len(parts) > 6: raise ValueError(f"bad FEN {fen!r}")
+        rows = parts[0].split('/')
+        if len(rows) != 8: raise ValueError(f"bad FEN board {parts[0]!r}")
+        board = []
+        for row in rows:
+            squares = []
+            for ch in row:
+                if ch.isdigit(): squares.extend('.' * int(ch))
+                elif ch in PIECES: squares.append(ch)
+                else: raise ValueError(f"bad FEN piece {ch!r}")
+            if len(squares) != 8: raise ValueError(f"bad FEN rank {row!r}")
+            board.append(squares)
+        # pawns never stand on the first or last rank (move generation would run off the board)
+        if {'P', 'p'} & set(board[0] + board[7]): raise ValueError(f"bad FEN: pawn on the back rank in {parts[0]!r}")
+        if parts[1] not in (WHITE, BLACK): raise ValueError(f"bad FEN side to move {parts[1]!r}")
+        rights = parts[2] if len(parts) > 2 else '-'
+        if rights != '-' and (not rights or set(rights) - set('KQkq')): raise ValueError(f"bad FEN castling {rights!r}")
+        try:
+            half = int(parts[4]) if len(parts) > 4 else 0
+            full = int(parts[5]) if len(parts) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad FEN clocks in {fen!r}") from None
+        self.board = board
+        self.turn = parts[1]
+        # a right only counts while its king and rook are on their home squares (others are dropped)
+        castling = {}
+        for name, flag in (('w_k','K'),('w_q','Q'),('b_k','k'),('b_q','q')):
+            r = 7 if name[0] == WHITE else 0
+            king, rook = ('K','R') if name[0] == WHITE else ('k','r')
+            castling[name] = flag in rights and board[r][4] == king and board[r][7 if name[2] == 'k' else 0] == rook
+        self.castling = castling
+        self.halfmove_clock = half
+        self.fullmove_number = full
+        self.move_stack = []
+        self.sync_from_board()
+
+    def fen(self):
+        rows = []
+        for row in self.board:
+            text = ''
+            empty = 0
+            for p in row:
+                if p == '.': empty += 1; continue
+                if empty: text += str(empty); empty = 0
+                text += p
+            rows.append(text + (str(empty) if empty else ''))
+        rights = ''.join(ch for ch,bit in zip('KQkq', (CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ)) if self.castling_rights & bit)
+        return f"{'/'.join(rows)} {self.turn} {rights or '-'} - {self.halfmove_clock} {self.fullmove_number}"
+
+    def clone(self, history=True):
+        # Copy of the position without deepcopy. history=True also copies the undo stack and move_stack
+        # (flat slices; Move objects are shared), so the copy can undo_move back through the game.
+        # history=False starts an empty undo stack and keeps only the earlier position hashes (for
+        # repetition detection). Those are a chain of immutable segments shared with this board: only
+        # the hashes on this board's own undo stack are copied into a new segment, so a copy of a copy
+        # does not pay for the game again.
+        b = Board.__new__(Board)
+        b.board = [row[:] for row in self.board]
+        b.turn = self.turn
+        b.castling_rights = self.castling_rights
+        b.halfmove_clock = self.halfmove_clock
+        b.fullmove_number = self.fullmove_number
+        b.bitboards = self.bitboards.copy()
+        b.occupancy = self.occupancy.copy()
+        b.piece_lists = {WHITE: self.piece_lists[WHITE].copy(), BLACK: self.piece_lists[BLACK].copy()}
+        b.king_sq = self.king_sq.copy()
+        b.hash = self.hash
+        b.material = self.material.copy()
+        b.psq = self.psq.copy()
+        b._cache = None
+        if history:
+            b.move_stack = self.move_stack[:]
+            b._undo = self._undo[:]
+            b._ply = self._ply
+            b._prior_hashes = self._prior_hashes
+        else:
+            b.move_stack = []
+            b._undo = [0] * (256 * UNDO_SIZE)
+            b._ply = 0
+            b._prior_hashes = (self._prior_hashes, tuple(self._undo[4:self._ply*UNDO_SIZE:UNDO_SIZE])) if self._ply else self._prior_hashes
+        return b
+
+    def snapshot(self, history=True):
+        # Plain picklable tuple of the position (for sending to other processes); see from_snapshot
+        prior = tuple(self.history_hashes()) if history else ()
+        return (tuple(self.bitboards[p] for p in PIECES), self.turn, self.castling_rights,
+                self.halfmove_clock, self.fullmove_number, self.hash, prior)
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        bitboards, turn, rights, half, full, h, prior = snap
+        b = cls.__new__(cls)
+        b.board = [['.' for _ in range(8)] for _ in range(8)]
+        b.turn = turn
+        b.castling_rights = rights
+        b.halfmove_clock = half
+        b.fullmove_number = full
+        b.move_stack = []
+        b.bitboards = dict(zip(PIECES, bitboards))
+        b.occupancy = {WHITE:0, BLACK:0}
+        b.piece_lists = {WHITE:{}, BLACK:{}}
+        b.king_sq = {WHITE:None, BLACK:None}
+        for p,bb in b.bitboards.items():
+            color = WHITE if p.isupper() else BLACK
+            b.occupancy[color] |= bb
+            for sq in iter_bits(bb):
+                b.board[sq >> 3][sq & 7] = p
+                b.piece_lists[color][sq] = p
+                if p in 'Kk': b.king_sq[color] = sq
+        b.hash = h
+        b.material, b.psq = b.compute_eval_terms()
+        b._cache = None
+        b._undo = [0] * (256 * UNDO_SIZE)
+        b._ply = 0
+        b._prior_hashes = (None, prior) if prior else None
+        return b
+
+    @property
+    def castling(self):
+        return {name: bool(self.castling_rights & bit) for name,bit in CASTLING_NAMES}
+
+    @castling.setter
+    def castling(self, rights):
+        self.castling_rights = sum(bit for name,bit in CASTLING_NAMES if rights.get(name))
 
     def init_board(self):
         setup = [
@@ -55,10 +383,71 @@ class Board:
             for c in range(8):
                 self.board[r][c] = setup[r][c]
         self.turn = WHITE
-        self.castling = {'w_k':True,'w_q':True,'b_k':True,'b_q':True}
+        self.castling_rights = 15
         self.move_stack = []
         self.halfmove_clock = 0
         self.fullmove_number = 1
+        self.sync_from_board()
+
+    def sync_from_board(self):
+        # Rebuild bitboards, piece lists and hash from the board[r][c] view (after editing self.board directly)
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {WHITE:0, BLACK:0}
+        self.piece_lists = {WHITE:{}, BLACK:{}}
+        self.king_sq = {WHITE:None, BLACK:None}
+        for r in range(8):
+            for c in range(8):
+                p = self.board[r][c]
+                if p=='.': continue
+                color = self.piece_color(p)
+                b = 1 << (r*8+c)
+                self.bitboards[p] |= b
+                self.occupancy[color] |= b
+                self.piece_lists[color][r*8+c] = p
+                if p in 'Kk': self.king_sq[color] = r*8+c
+        self.hash = self.compute_hash()
+        self.material, self.psq = self.compute_eval_terms()
+        self._ply = 0
+        self._prior_hashes = None
+        self._cache = None
+
+    def compute_hash(self):
+        h = ZOBRIST_BLACK if self.turn==BLACK else 0
+        for p in PIECES:
+            keys = ZOBRIST_PIECES[p]
+            for sq in iter_bits(self.bitboards[p]):
+                h ^= keys[sq]
+        return h ^ ZOBRIST_CASTLING[self.castling_rights]
+
+    def _check_hash(self):
+        if self.hash != self.compute_hash():
+            raise AssertionError(f"Zobrist hash out of sync: {self.hash:#018x} != {self.compute_hash():#018x}")
+
+    def compute_eval_terms(self):
+        # (material, piece-square) per colour from scratch
+        material = {WHITE:0, BLACK:0}
+        psq = {WHITE:0, BLACK:0}
+        for color, pieces in self.piece_lists.items():
+            for sq, p in pieces.items():
+                material[color] += PIECE_MATERIAL[p]
+                psq[color] += EVAL_SQUARE[p][sq]
+        return material, psq
+
+    def _check_eval(self):
+        material, psq = self.compute_eval_terms()
+        if self.material != material or self.psq != psq:
+            raise AssertionError(f"evaluation terms out of sync: material {self.material} != {material}, psq {self.psq} != {psq}")
+
+    def history_hashes(self):
+        # hashes of the earlier positions of the game, oldest first.
+        # _prior_hashes is None or (older, segment): the hashes from before this board's undo stack
+        segments = []
+        chain = self._prior_hashes
+        while chain is not None:
+            chain, segment = chain
+            segments.append(segment)
+        hashes = [h for segment in reversed(segments) for h in segment]
+        return hashes + self._undo[4:self._ply*UNDO_SIZE:UNDO_SIZE]
 
     def print_board(self):
         print("  +-----------------+")
@@ -74,255 +463,457 @@ class Board:
         if p == '.': return None
         return WHITE if p.isupper() else BLACK
 
+    def piece_at(self, sq):
+        return self.board[sq >> 3][sq & 7]
+
+    def _king_square(self, color):
+        return self.king_sq[color]
+
     def find_king(self, color):
-        k = 'K' if color==WHITE else 'k'
-        for r in range(8):
-            for c in range(8):
-                if self.board[r][c] == k:
-                    return (r,c)
-        return None
+        sq = self._king_square(color)
+        return None if sq is None else SQUARE_RC[sq]
 
     def is_square_attacked(self, sq, by_color):
-        r0,c0 = sq
-        # Pawns
-        if by_color == WHITE:
-            dirs = [(-1,-1),(-1,1)]
-            pawn = 'P'
-        else:
-            dirs = [(1,-1),(1,1)]
-            pawn = 'p'
-        for dr,dc in dirs:
-            r,c = r0+dr, c0+dc
-            if in_bounds(r,c) and self.board[r][c]==pawn:
-                return True
-        # Knights
-        knight = 'N' if by_color==WHITE else 'n'
-        for dr,dc in DIRS_KNIGHT:
-            r,c = r0+dr, c0+dc
-            if in_bounds(r,c) and self.board[r][c]==knight:
-                return True
-        # Bishops/Queens
-        for dr,dc in DIRS_BISHOP:
-            r,c = r0+dr,c0+dc
-            while in_bounds(r,c):
-                ch = self.board[r][c]
-                if ch != '.':
-                    if self.piece_color(ch)==by_color and ch.lower() in ['b','q']:
-                        return True
-                    break
-                r+=dr; c+=dc
-        # Rooks/Queens
-        for dr,dc in DIRS_ROOK:
-            r,c = r0+dr,c0+dc
-            while in_bounds(r,c):
-                ch = self.board[r][c]
-                if ch != '.':
-                    if self.piece_color(ch)==by_color and ch.lower() in ['r','q']:
-                        return True
-                    break
-                r+=dr;c+=dc
-        # King
-        king = 'K' if by_color==WHITE else 'k'
-        for dr,dc in DIRS_KING:
-            r,c = r0+dr, c0+dc
-            if in_bounds(r,c) and self.board[r][c]==king:
-                return True
+        return self._attacked(sq_index(sq), by_color, self.occupancy[WHITE] | self.occupancy[BLACK])
+
+    def _attackers(self, sq, by_color, occ):
+        # bitboard of by_color pieces attacking sq
+        P,N,B,R,Q,K = COLOR_PIECES[by_color]
+        bb = self.bitboards
+        return ((PAWN_ATTACKS[BLACK if by_color==WHITE else WHITE][sq] & bb[P])
+                | (KNIGHT_ATTACKS[sq] & bb[N])
+                | (KING_ATTACKS[sq] & bb[K])
+                | (BISHOP_TABLE[sq][occ & BISHOP_MASK[sq]] & (bb[B] | bb[Q]))
+                | (ROOK_TABLE[sq][occ & ROOK_MASK[sq]] & (bb[R] | bb[Q])))
+
+    def _attacked(self, sq, by_color, occ):
+        P,N,B,R,Q,K = COLOR_PIECES[by_color]
+        bb = self.bitboards
+        # Pawns: a pawn of by_color attacks sq iff a pawn of the other colour on sq would attack it
+        if PAWN_ATTACKS[BLACK if by_color==WHITE else WHITE][sq] & bb[P]: return True
+        if KNIGHT_ATTACKS[sq] & bb[N]: return True
+        if KING_ATTACKS[sq] & bb[K]: return True
+        diag = bb[B] | bb[Q]
+        if diag and BISHOP_TABLE[sq][occ & BISHOP_MASK[sq]] & diag: return True
+        line = bb[R] | bb[Q]
+        if line and ROOK_TABLE[sq][occ & ROOK_MASK[sq]] & line: return True
         return False
 
+    def decode_move(self, code):
+        # Move object for a packed move in the current position
+        f = code & 63; t = code >> 6 & 63
+        piece = self.board[f >> 3][f & 7]
+        target = self.board[t >> 3][t & 7]
+        promo = code >> 12 & 7
+        m = Move(SQUARE_RC[f], SQUARE_RC[t], piece, captured=(target if target!='.' else None),
+                 promotion=(PROMO_PIECES[self.piece_color(piece)][promo] if promo else None),
+                 is_castling=bool(code & MOVE_CASTLE))
+        m._code = code
+        return m
+
+    def move_from_uci(self, text):
+        # legal Move for coordinate notation like e2e4 / e7e8q, or None
+        for code in self.legal_codes():
+            if code_uci(code) == text.strip().lower(): return self.decode_move(code)
+        return None
+
+    def san(self, code):
+        # Standard algebraic notation of a legal packed move, e.g. Nbd2, exd5, e8=Q+, O-O#
+        text = self._san_base(code, self.legal_codes())
+        self.make_code(code)
+        if self.is_in_check(self.turn):
+            text += '+' if self.legal_moves_exist(self.turn) else '#'
+        self.unmake_code()
+        return text
+
+    def _san_base(self, code, legal):
+        # SAN without the check mark; legal is the position's legal_codes(), for disambiguation
+        s1 = code & 63; s2 = code >> 6 & 63
+        if code & MOVE_CASTLE:
+            return 'O-O' if (s2 & 7) == 6 else 'O-O-O'
+        uci = code_uci(code)
+        p = self.piece_at(s1)
+        capture = 'x' if self.piece_at(s2) != '.' else ''
+        if p in 'Pp':
+            promo = code >> 12 & 7
+            return (uci[0] + capture if capture else '') + uci[2:4] + ('=' + PROMO_PIECES[WHITE][promo] if promo else '')
+        # disambiguate against other pieces of the same kind reaching the same square
+        others = [m & 63 for m in legal if m >> 6 & 63 == s2 and m & 63 != s1 and self.piece_at(m & 63) == p]
+        prefix = ''
+        if others:
+            if all((o & 7) != (s1 & 7) for o in others): prefix = uci[0]
+            elif all((o >> 3) != (s1 >> 3) for o in others): prefix = uci[1]
+            else: prefix = uci[:2]
+        return p.upper() + prefix + capture + uci[2:4]
+
+    def parse_san(self, text):
+        # legal Move for SAN like Nf3, exd5, e8=Q, O-O (check marks, annotations and '=' optional), or None
+        wanted = text.strip().rstrip('+#!?').replace('0', 'O').replace('=', '')
+        legal = self.legal_codes()
+        candidates = legal
+        if not wanted.startswith('O'):
+            # only moves to the named square need their SAN built (game import parses a lot of these)
+            dest = wanted.rstrip('NBRQnbrq')[-2:]
+            if len(dest) == 2 and dest[0] in 'abcdefgh' and dest[1] in '12345678':
+                to = (8 - int(dest[1])) * 8 + ord(dest[0]) - ord('a')
+                candidates = [code for code in legal if code >> 6 & 63 == to]
+        for code in candidates:
+            if self._san_base(code, legal).replace('=', '') == wanted: return self.decode_move(code)
+        return None
+
     def generate_pseudo_legal_moves(self):
+        return [self.decode_move(code) for code in self.pseudo_legal_codes()]
+
+    def pseudo_legal_codes(self):
         moves = []
-        for r in range(8):
-            for c in range(8):
-                p = self.board[r][c]
-                if p=='.': continue
-                if self.piece_color(p)!=self.turn: continue
-                moves.extend(self._piece_moves((r,c),p))
+        for sq,p in self.piece_lists[self.turn].items():
+            moves.extend(self._piece_moves(sq,p))
         return moves
 
-    def _piece_moves(self,pos,p):
-        r,c = pos
-        color = self.piece_color(p)
+    def _piece_moves(self,sq,p,mask=ALL_SQUARES):
+        # Packed moves of the piece p on sq; mask limits the destinations (check evasions, pin lines, capture/quiet stages)
+        color = WHITE if p.isupper() else BLACK
         opp = BLACK if color==WHITE else WHITE
-        moves = []
+        own = self.occupancy[color]
+        occ = own | self.occupancy[opp]
         pl = p.lower()
         if pl=='p':
-            direction = -1 if color==WHITE else 1
-            start_row = 6 if color==WHITE else 1
+            moves = []
+            step = -8 if color==WHITE else 8
             # forward
-            r1 = r+direction
-            if in_bounds(r1,c) and self.board[r1][c]=='.':
-                if r1==0 or r1==7:
-                    for promo in ['Q','R','B','N']:
-                        promo_piece = promo if color==WHITE else promo.lower()
-                        moves.append(Move((r,c),(r1,c),p,promotion=promo_piece))
-                else:
-                    moves.append(Move((r,c),(r1,c),p))
-                r2 = r+2*direction
-                if r==start_row and in_bounds(r2,c) and self.board[r2][c]=='.':
-                    moves.append(Move((r,c),(r2,c),p))
-            # capture
-            for dc in [-1,1]:
-                rr,cc = r+direction, c+dc
-                if in_bounds(rr,cc) and self.board[rr][cc]!='.' and self.piece_color(self.board[rr][cc])==opp:
-                    if rr==0 or rr==7:
-                        for promo in ['Q','R','B','N']:
-                            promo_piece = promo if color==WHITE else promo.lower()
-                            moves.append(Move((r,c),(rr,cc),p,captured=self.board[rr][cc],promotion=promo_piece))
+            t = sq+step
+            if not occ & (1 << t):
+                if mask & (1 << t):
+                    if t < 8 or t >= 56:
+                        for promo in (4,3,2,1):
+                            moves.append(sq | t << 6 | promo << 12)
                     else:
-                        moves.append(Move((r,c),(rr,cc),p,captured=self.board[rr][cc]))
+                        moves.append(sq | t << 6)
+                t2 = t+step
+                if (sq >> 3)==(6 if color==WHITE else 1) and not occ & (1 << t2) and mask & (1 << t2):
+                    moves.append(sq | t2 << 6)
+            # capture
+            for t in iter_bits(PAWN_ATTACKS[color][sq] & self.occupancy[opp] & mask):
+                if t < 8 or t >= 56:
+                    for promo in (4,3,2,1):
+                        moves.append(sq | t << 6 | promo << 12)
+                else:
+                    moves.append(sq | t << 6)
+            return moves
         elif pl=='n':
-            for dr,dc in DIRS_KNIGHT:
-                rr,cc = r+dr,c+dc
-                if not in_bounds(rr,cc): continue
-                target = self.board[rr][cc]
-                if target=='.' or self.piece_color(target)==opp:
-                    moves.append(Move((r,c),(rr,cc),p,captured=(target if target!='.' else None)))
-        elif pl in ['b','r','q']:
-            dirs = DIRS_BISHOP if pl=='b' else DIRS_ROOK if pl=='r' else DIRS_BISHOP+DIRS_ROOK
-            for dr,dc in dirs:
-                rr,cc = r+dr,c+dc
-                while in_bounds(rr,cc):
-                    target = self.board[rr][cc]
-                    if target=='.':
-                        moves.append(Move((r,c),(rr,cc),p))
-                    else:
-                        if self.piece_color(target)==opp:
-                            moves.append(Move((r,c),(rr,cc),p,captured=target))
-                        break
-                    rr+=dr; cc+=dc
-        elif pl=='k':
-            for dr,dc in DIRS_KING:
-                rr,cc = r+dr,c+dc
-                if not in_bounds(rr,cc): continue
-                target = self.board[rr][cc]
-                if target=='.' or self.piece_color(target)==opp:
-                    # simulate king move
-                    orig_from, orig_to = self.board[r][c], self.board[rr][cc]
-                    self.board[rr][cc]=p
-                    self.board[r][c]='.'
-                    if not self.is_square_attacked((rr,cc),opp):
-                        moves.append(Move((r,c),(rr,cc),p,captured=(target if target!='.' else None)))
-                    self.board[r][c]=orig_from
-                    self.board[rr][cc]=orig_to
+            targets = KNIGHT_ATTACKS[sq] & ~own & mask
+        elif pl=='b':
+            targets = bishop_attacks(sq,occ) & ~own & mask
+        elif pl=='r':
+            targets = rook_attacks(sq,occ) & ~own & mask
+        elif pl=='q':
+            targets = (bishop_attacks(sq,occ) | rook_attacks(sq,occ)) & ~own & mask
+        else:
+            # king: drop steps onto attacked squares (king removed from occupancy so it can't hide behind itself)
+            targets = 0
+            occ_wo_king = occ ^ (1 << sq)
+            for t in iter_bits(KING_ATTACKS[sq] & ~own & mask):
+                if not self._attacked(t, opp, occ_wo_king):
+                    targets |= 1 << t
+            moves = [sq | t << 6 for t in iter_bits(targets)]
             # castling
+            board = self.board
+            rights = self.castling_rights
             if color==WHITE:
                 # King side
-                if self.castling['w_k'] and self.board[7][5]=='.' and self.board[7][6]=='.' and self.board[7][7]=='R':
-                    if not any(self.is_square_attacked(sq,BLACK) for sq in [(7,4),(7,5),(7,6)]):
-                        moves.append(Move((7,4),(7,6),'K',is_castling=True))
+                if rights & CASTLE_WK and mask >> 62 & 1 and board[7][5]=='.' and board[7][6]=='.' and board[7][7]=='R':
+                    if not any(self._attacked(s,BLACK,occ) for s in (60,61,62)):
+                        moves.append(60 | 62 << 6 | MOVE_CASTLE)
                 # Queen side
-                if self.castling['w_q'] and self.board[7][1]=='.' and self.board[7][2]=='.' and self.board[7][3]=='.' and self.board[7][0]=='R':
-                    if not any(self.is_square_attacked(sq,BLACK) for sq in [(7,4),(7,3),(7,2)]):
-                        moves.append(Move((7,4),(7,2),'K',is_castling=True))
+                if rights & CASTLE_WQ and mask >> 58 & 1 and board[7][1]=='.' and board[7][2]=='.' and board[7][3]=='.' and board[7][0]=='R':
+                    if not any(self._attacked(s,BLACK,occ) for s in (60,59,58)):
+                        moves.append(60 | 58 << 6 | MOVE_CASTLE)
             else:
-                if self.castling['b_k'] and self.board[0][5]=='.' and self.board[0][6]=='.' and self.board[0][7]=='r':
-                    if not any(self.is_square_attacked(sq,WHITE) for sq in [(0,4),(0,5),(0,6)]):
-                        moves.append(Move((0,4),(0,6),'k',is_castling=True))
-                if self.castling['b_q'] and self.board[0][1]=='.' and self.board[0][2]=='.' and self.board[0][3]=='.' and self.board[0][0]=='r':
-                    if not any(self.is_square_attacked(sq,WHITE) for sq in [(0,4),(0,3),(0,2)]):
-                        moves.append(Move((0,4),(0,2),'k',is_castling=True))
-        return moves
-
-    def _make_move_on_board(self,m):
-        r1,c1 = m.from_sq; r2,c2 = m.to_sq
-        prev_from = self.board[r1][c1]
-        prev_to = self.board[r2][c2]
-        prev_castling = self.castling.copy()
-        prev_half = self.halfmove_clock
-        prev_full = self.fullmove_number
+                if rights & CASTLE_BK and mask >> 6 & 1 and board[0][5]=='.' and board[0][6]=='.' and board[0][7]=='r':
+                    if not any(self._attacked(s,WHITE,occ) for s in (4,5,6)):
+                        moves.append(4 | 6 << 6 | MOVE_CASTLE)
+                if rights & CASTLE_BQ and mask >> 2 & 1 and board[0][1]=='.' and board[0][2]=='.' and board[0][3]=='.' and board[0][0]=='r':
+                    if not any(self._attacked(s,WHITE,occ) for s in (4,3,2)):
+                        moves.append(4 | 2 << 6 | MOVE_CASTLE)
+            return moves
+        return [sq | t << 6 for t in iter_bits(targets)]
+
+    def _move_piece(self, piece, s_from, s_to):
+        # relocate piece on every representation (rook hops of castling)
+        self.board[s_from >> 3][s_from & 7] = '.'
+        self.board[s_to >> 3][s_to & 7] = piece
+        hop = (1 << s_from) | (1 << s_to)
+        self.bitboards[piece] ^= hop
+        color = WHITE if piece.isupper() else BLACK
+        self.occupancy[color] ^= hop
+        pieces = self.piece_lists[color]
+        del pieces[s_from]
+        pieces[s_to] = piece
+        keys = ZOBRIST_PIECES[piece]
+        self.hash ^= keys[s_from] ^ keys[s_to]
+        table = EVAL_SQUARE[piece]
+        self.psq[color] += table[s_to] - table[s_from]
+
+    def make_code(self, code):
+        # Play a packed move; the undo record goes into the preallocated _undo array
+        s1 = code & 63; s2 = code >> 6 & 63
+        board = self.board
+        row1 = board[s1 >> 3]; row2 = board[s2 >> 3]
+        moved = row1[s1 & 7]
+        captured = row2[s2 & 7]
+        color = self.turn
+        rights = self.castling_rights
+
+        u = self._undo
+        i = self._ply * UNDO_SIZE
+        if i >= len(u): u.extend([0] * len(u))
+        u[i] = code; u[i+1] = captured; u[i+2] = rights; u[i+3] = self.halfmove_clock; u[i+4] = self.hash
+        self._ply += 1
 
         # move
-        self.board[r2][c2] = m.promotion if m.promotion else self.board[r1][c1]
-        self.board[r1][c1]='.'
-
-        # castling
-        if m.is_castling:
-            if m.piece=='K':
-                if (r2,c2)==(7,6):
-                    self.board[7][5]=self.board[7][7]; self.board[7][7]='.'
-                else:
-                    self.board[7][3]=self.board[7][0]; self.board[7][0]='.'
-            else:
-                if (r2,c2)==(0,6):
-                    self.board[0][5]=self.board[0][7]; self.board[0][7]='.'
-                else:
-                    self.board[0][3]=self.board[0][0]; self.board[0][0]='.'
-
-        # update castling rights
-        if prev_from in ['K','k']:
-            if prev_from=='K': self.castling['w_k']=self.castling['w_q']=False
-            else: self.castling['b_k']=self.castling['b_q']=False
-        if (r1,c1)==(7,0) or (r2,c2)==(7,0): self.castling['w_q']=False
-        if (r1,c1)==(7,7) or (r2,c2)==(7,7): self.castling['w_k']=False
-        if (r1,c1)==(0,0) or (r2,c2)==(0,0): self.castling['b_q']=False
-        if (r1,c1)==(0,7) or (r2,c2)==(0,7): self.castling['b_k']=False
+        promo = code >> 12 & 7
+        placed = PROMO_PIECES[color][promo] if promo else moved
+        row2[s2 & 7] = placed
+        row1[s1 & 7] = '.'
+        b1 = 1 << s1; b2 = 1 << s2
+        bb = self.bitboards
+        bb[moved] ^= b1
+        bb[placed] ^= b2
+        h = self.hash ^ ZOBRIST_PIECES[moved][s1] ^ ZOBRIST_PIECES[placed][s2] ^ ZOBRIST_BLACK
+        psq = self.psq
+        psq[color] += EVAL_SQUARE[placed][s2] - EVAL_SQUARE[moved][s1]
+        if promo: self.material[color] += PIECE_MATERIAL[placed] - PIECE_MATERIAL[moved]
+        if captured!='.':
+            opp = BLACK if color==WHITE else WHITE
+            bb[captured] ^= b2
+            self.occupancy[opp] ^= b2
+            del self.piece_lists[opp][s2]
+            h ^= ZOBRIST_PIECES[captured][s2]
+            psq[opp] -= EVAL_SQUARE[captured][s2]
+            self.material[opp] -= PIECE_MATERIAL[captured]
+        self.occupancy[color] ^= b1 | b2
+        pieces = self.piece_lists[color]
+        del pieces[s1]
+        pieces[s2] = placed
+        if moved=='K' or moved=='k': self.king_sq[color] = s2
+
+        # castling rights
+        new_rights = rights & CASTLE_KEEP[s1] & CASTLE_KEEP[s2]
+        if new_rights != rights:
+            self.castling_rights = new_rights
+            h ^= ZOBRIST_CASTLING[rights] ^ ZOBRIST_CASTLING[new_rights]
+        self.hash = h
+
+        # castling rook hop
+        if code & MOVE_CASTLE:
+            rook_from, rook_to = CASTLE_ROOK[s2]
+            self._move_piece(board[rook_from >> 3][rook_from & 7], rook_from, rook_to)
 
         # halfmove clock
-        if prev_to!='.' or prev_from.lower()=='p': self.halfmove_clock=0
+        if captured!='.' or moved=='P' or moved=='p': self.halfmove_clock=0
         else: self.halfmove_clock+=1
 
         # switch turn
-        self.turn = BLACK if self.turn==WHITE else WHITE
-        if self.turn==WHITE: self.fullmove_number+=1
-
-        return (prev_from,prev_to,prev_castling,prev_half,prev_full)
-
-    def _unmake_move_on_board(self,m,prev):
-        r1,c1 = m.from_sq; r2,c2 = m.to_sq
-        prev_from,prev_to,prev_castling,prev_half,prev_full=prev
-        self.board[r1][c1]=prev_from
-        self.board[r2][c2]=prev_to if prev_to!='.' else '.'
-
-        # undo castling
-        if m.is_castling:
-            if m.piece=='K':
-                if (r2,c2)==(7,6): self.board[7][7]=self.board[7][5]; self.board[7][5]='.'
-                else: self.board[7][0]=self.board[7][3]; self.board[7][3]='.'
-            else:
-                if (r2,c2)==(0,6): self.board[0][7]=self.board[0][5]; self.board[0][5]='.'
-                else: self.board[0][0]=self.board[0][3]; self.board[0][3]='.'
-
-        self.castling=prev_castling
-        self.halfmove_clock=prev_half
-        self.fullmove_number=prev_full
-        self.turn = BLACK if self.turn==WHITE else WHITE
+        if color==WHITE:
+            self.turn = BLACK
+        else:
+            self.turn = WHITE
+            self.fullmove_number+=1
+
+        if self.debug_hash: self._check_hash()
+        if self.debug_eval: self._check_eval()
+
+    def unmake_code(self):
+        # Take back the last make_code
+        self._ply -= 1
+        u = self._undo
+        i = self._ply * UNDO_SIZE
+        code = u[i]; captured = u[i+1]
+        s1 = code & 63; s2 = code >> 6 & 63
+
+        if self.turn==WHITE:
+            color = BLACK
+            self.fullmove_number-=1
+        else:
+            color = WHITE
+        self.turn = color
+
+        # undo castling rook hop (its hash update is discarded with the restore below)
+        if code & MOVE_CASTLE:
+            rook_from, rook_to = CASTLE_ROOK[s2]
+            self._move_piece(self.board[rook_to >> 3][rook_to & 7], rook_to, rook_from)
+
+        board = self.board
+        row1 = board[s1 >> 3]; row2 = board[s2 >> 3]
+        placed = row2[s2 & 7]
+        promo = code >> 12 & 7
+        moved = ('P' if color==WHITE else 'p') if promo else placed
+        row1[s1 & 7] = moved
+        row2[s2 & 7] = captured
+        b1 = 1 << s1; b2 = 1 << s2
+        bb = self.bitboards
+        bb[placed] ^= b2
+        bb[moved] ^= b1
+        self.occupancy[color] ^= b1 | b2
+        pieces = self.piece_lists[color]
+        del pieces[s2]
+        pieces[s1] = moved
+        if moved=='K' or moved=='k': self.king_sq[color] = s1
+        psq = self.psq
+        psq[color] += EVAL_SQUARE[moved][s1] - EVAL_SQUARE[placed][s2]
+        if promo: self.material[color] += PIECE_MATERIAL[moved] - PIECE_MATERIAL[placed]
+        if captured!='.':
+            opp = BLACK if color==WHITE else WHITE
+            bb[captured] ^= b2
+            self.occupancy[opp] ^= b2
+            self.piece_lists[opp][s2] = captured
+            psq[opp] += EVAL_SQUARE[captured][s2]
+            self.material[opp] += PIECE_MATERIAL[captured]
+
+        self.castling_rights = u[i+2]
+        self.halfmove_clock = u[i+3]
+        self.hash = u[i+4]
+        if self.debug_hash: self._check_hash()
+        if self.debug_eval: self._check_eval()
+
+    def legal_codes(self):
+        moves = self._legal_moves()
+        if self.verify_movegen:
+            slow = self._valid_moves_by_make()
+            if sorted(moves) != sorted(slow):
+                raise AssertionError(f"legal move generator disagrees with make/test: {sorted(map(code_uci, moves))} != {sorted(map(code_uci, slow))}")
+        return moves
 
     def get_valid_moves(self):
-        pseudo = self.generate_pseudo_legal_moves()
+        return [self.decode_move(code) for code in self.legal_codes()]
+
+    def capture_codes(self):
+        # legal captures and promotions by push (capture stage of the search's move picker and quiescence)
+        enemy = self.occupancy[BLACK if self.turn==WHITE else WHITE]
+        promo = PROMOTION_RANK[self.turn] & ~(self.occupancy[WHITE] | enemy)
+        if not promo: return self._legal_moves(enemy)
+        # other pieces moving to the empty last-rank squares are quiet moves and are dropped again
+        return [m for m in self._legal_moves(enemy | promo) if m >> 12 & 7 or enemy >> (m >> 6 & 63) & 1]
+
+    def quiet_codes(self):
+        # legal moves onto empty squares except promotions: pushes and castling included
+        return [m for m in self._legal_moves(ALL_SQUARES & ~(self.occupancy[WHITE] | self.occupancy[BLACK]))
+                if not m >> 12 & 7]
+
+    def is_legal_code(self, code):
+        # Whether a packed move from elsewhere (hash table, killer slot) is legal here
+        s1 = code & 63
+        us = self.turn
+        p = self.piece_lists[us].get(s1)
+        if p is None or code not in self._piece_moves(s1, p, 1 << (code >> 6 & 63)): return False
+        self.make_code(code)
+        legal = not self._attacked(self.king_sq[us], self.turn, self.occupancy[WHITE] | self.occupancy[BLACK])
+        self.unmake_code()
+        return legal
+
+    def _legal_moves(self, targets=ALL_SQUARES):
+        # Legal moves straight from checkers and pins, computed once for the position; targets limits the destinations
+        us = self.turn
+        them = BLACK if us==WHITE else WHITE
+        ksq = self._king_square(us)
+        if ksq is None: return []
+        own = self.occupancy[us]
+        occ = own | self.occupancy[them]
+        # king steps are checked against attacks; castling is refused while in check
+        moves = self._piece_moves(ksq, self.piece_lists[us][ksq], targets)
+        checkers = self._attackers(ksq, them, occ)
+        if checkers & (checkers-1): return moves   # double check: only the king moves
+        mask = targets
+        if checkers:
+            # capture the checker or block the line
+            mask &= checkers | BETWEEN[ksq][checkers.bit_length()-1]
+        # a piece alone between our king and an enemy slider may only move along that line
+        P,N,B,R,Q,K = COLOR_PIECES[them]
+        bb = self.bitboards
+        pins = {}
+        snipers = (rook_attacks(ksq, 0) & (bb[R] | bb[Q])) | (bishop_attacks(ksq, 0) & (bb[B] | bb[Q]))
+        for s in iter_bits(snipers):
+            blockers = BETWEEN[ksq][s] & occ
+            if blockers and not blockers & (blockers-1) and blockers & own:
+                pins[blockers.bit_length()-1] = BETWEEN[ksq][s] | (1 << s)
+        for sq,p in self.piece_lists[us].items():
+            if sq == ksq: continue
+            target_mask = mask & pins[sq] if sq in pins else mask
+            if target_mask:
+                moves.extend(self._piece_moves(sq, p, target_mask))
+        return moves
+
+    def _valid_moves_by_make(self):
+        # Reference generator: make every pseudo-legal move and test the king (verification mode)
         legal = []
-        for m in pseudo:
-            prev = self._make_move_on_board(m)
-            king_pos = self.find_king(BLACK if self.turn==WHITE else WHITE)
-            if king_pos and not self.is_square_attacked(king_pos, self.turn):
-                legal.append(m)
-            self._unmake_move_on_board(m,prev)
+        mover = self.turn
+        for code in self.pseudo_legal_codes():
+            self.make_code(code)
+            king_sq = self._king_square(mover)
+            if king_sq is not None and not self._attacked(king_sq, self.turn, self.occupancy[WHITE] | self.occupancy[BLACK]):
+                legal.append(code)
+            self.unmake_code()
         return legal
 
-    def apply_move(self,m):
-        prev = self._make_move_on_board(m)
-        self.move_stack.append((m,prev))
+    def apply_move(self,m,with_san=False):
+        # with_san: store the move's SAN on m first, for move lists (one legal move generation)
+        if with_san: m.san = self.san(m.code)
+        self.make_code(m.code)
+        self.move_stack.append(m)
+        self._cache = None
 
     def undo_move(self):
         if not self.move_stack: return
-        m,prev = self.move_stack.pop()
-        self._unmake_move_on_board(m,prev)
+        self.move_stack.pop()
+        self.unmake_code()
+        self._cache = None
+
+    # --- Cached per-position queries (for the UI loop): computed once, dropped by apply_move/undo_move ---
+    def _position_cache(self):
+        c = self._cache
+        if c is None or c[0] != self.hash:
+            moves = self.get_valid_moves()
+            by_origin = {}
+            for m in moves:
+                by_origin.setdefault(m.from_sq, []).append(m)
+            in_check = self.is_in_check(self.turn)
+            status = None
+            if not moves: status = 'checkmate' if in_check else 'stalemate'
+            c = self._cache = (self.hash, moves, by_origin, in_check, status)
+        return c
+
+    def valid_moves_from(self, sq):
+        # legal moves of the piece on sq=(r,c); shared list, don't modify
+        return self._position_cache()[2].get(sq, [])
+
+    def in_check(self):
+        # side to move is in check
+        return self._position_cache()[3]
+
+    def game_status(self):
+        # 'checkmate', 'stalemate' or None while the side to move has a legal move
+        return self._position_cache()[4]
 
     def is_in_check(self,color):
-        king = self.find_king(color)
+        king = self._king_square(color)
         if king is None: return True
-        return self.is_square_attacked(king, BLACK if color==WHITE else WHITE)
+        return self._attacked(king, BLACK if color==WHITE else WHITE, self.occupancy[WHITE] | self.occupancy[BLACK])
 
     def legal_moves_exist(self,color):
         saved = self.turn
-        self.turn=color
-        moves = self.get_valid_moves()
-        self.turn=saved
+        if color!=saved:
+            self.turn=color; self.hash^=ZOBRIST_BLACK
+        moves = self._legal_moves()
+        if color!=saved:
+            self.turn=saved; self.hash^=ZOBRIST_BLACK
         return len(moves)>0
 
     def is_checkmate(self,color):
+        if color==self.turn: return self.game_status()=='checkmate'
         return self.is_in_check(color) and not self.legal_moves_exist(color)
 
     def is_stalemate(self,color):
+        if color==self.turn: return self.game_status()=='stalemate'
         return not self.is_in_check(color) and not self.legal_moves_exist(color)
 
 
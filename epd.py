@@ -0,0 +1,98 @@
+# epd.py - EPD parsing and a test-suite runner over a process pool
+#
+#   python epd.py wac.epd -t 1.0 -w 8
+#
+# An EPD line is the first four FEN fields followed by operations, e.g.
+#   r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - bm Qxf7#; id "mate.1";
+# A position counts as solved when the move found within the time limit is one of its bm moves
+# (if any) and none of its am moves.
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from engine import Board
+from search import Searcher
+
+def parse_epd(line):
+    # (FEN, {opcode: [operands]}); hmvc/fmvn operations fill in the clocks
+    fields = line.split(None, 4)
+    if len(fields) < 4: raise ValueError(f"bad EPD line {line!r}")
+    ops = {}
+    for op in _split_ops(fields[4] if len(fields) > 4 else ''):
+        ops[op[0]] = op[1:]
+    half = ops.get('hmvc', ['0'])[0]
+    full = ops.get('fmvn', ['1'])[0]
+    return ' '.join(fields[:4] + [half, full]), ops
+
+def _split_ops(text):
+    # operations are separated by ';', operands by spaces; quoted strings keep both
+    ops, words, word, quoted = [], [], '', False
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif quoted or not (ch.isspace() or ch == ';'):
+            word += ch
+        else:
+            if word: words.append(word); word = ''
+            if ch == ';' and words: ops.append(words); words = []
+    if word: words.append(word)
+    if words: ops.append(words)
+    return ops
+
+def read_epd(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def _solve_job(index, line, time_limit):
+    fen, ops = parse_epd(line)
+    board = Board(fen)
+    expected = {}
+    for op in ('bm', 'am'):
+        codes = set()
+        for san in ops.get(op, []):
+            move = board.parse_san(san)
+            if move is None: raise ValueError(f"position {index + 1}: {op} {san!r} is not a legal move")
+            codes.add(move.code)
+        expected[op] = codes
+    r = Searcher().search(board, time_limit=time_limit)
+    code = r.move.code if r.move else None
+    solved = (not expected['bm'] or code in expected['bm']) and code not in expected['am']
+    return {'index': index, 'id': ops.get('id', [str(index + 1)])[0], 'move': board.san(code) if code is not None else '-',
+            'bm': ops.get('bm', []), 'am': ops.get('am', []), 'solved': solved,
+            'depth': r.depth, 'nodes': r.nodes, 'seconds': r.elapsed}
+
+def run_suite(lines, time_limit=1.0, workers=None):
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_solve_job, i, line, time_limit) for i, line in enumerate(lines)]
+        for job in as_completed(jobs):
+            try:
+                r = job.result()
+            except ValueError as e:
+                print(f"skipped: {e}")
+                continue
+            results.append(r)
+            wanted = ' '.join(['bm'] + r['bm'] if r['bm'] else ['am'] + r['am'])
+            print(f"{r['id']:<12} {'ok  ' if r['solved'] else 'FAIL'} {r['move']:<8} ({wanted})  "
+                  f"depth {r['depth']:>2}  {r['nodes']:>8} nodes  [{len(results)}/{len(lines)}]")
+    elapsed = time.perf_counter() - start
+    solved = sum(r['solved'] for r in results)
+    nodes = sum(r['nodes'] for r in results)
+    search_time = sum(r['seconds'] for r in results)
+    skipped = f", {len(lines) - len(results)} skipped" if len(results) < len(lines) else ""
+    print(f"solved {solved}/{len(results)} ({100 * solved / max(len(results), 1):.1f}%){skipped} in {elapsed:.1f}s")
+    print(f"{nodes} nodes: {nodes / max(search_time, 1e-9):,.0f} nodes/s per process, "
+          f"{nodes / max(elapsed, 1e-9):,.0f} nodes/s overall")
+    return sorted(results, key=lambda r: r['index'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve an EPD test suite (bm/am) with a per-position time limit")
+    parser.add_argument('suite', help="EPD file, one position per line")
+    parser.add_argument('-t', '--time', type=float, default=1.0, help="seconds per position")
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args(argv)
+    run_suite(read_epd(args.suite), args.time, args.workers)
+
+if __name__ == "__main__":
+    main()
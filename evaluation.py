@@ -0,0 +1,121 @@
+# evaluation.py - static evaluation: material + piece-square tables
+#
+# Tables are laid out like Board.board (index r*8+c, rank 8 first) from White's side;
+# a black piece on sq reads entry sq ^ 56 (same file, mirrored rank).
+# This module deliberately does not import engine: the engine uses these tables to keep
+# Board.material / Board.psq up to date, which is what makes evaluate() O(1).
+
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+PST = {
+    'p': [
+          0,  0,  0,  0,  0,  0,  0,  0,
+         50, 50, 50, 50, 50, 50, 50, 50,
+         10, 10, 20, 30, 30, 20, 10, 10,
+          5,  5, 10, 25, 25, 10,  5,  5,
+          0,  0,  0, 20, 20,  0,  0,  0,
+          5, -5,-10,  0,  0,-10, -5,  5,
+          5, 10, 10,-20,-20, 10, 10,  5,
+          0,  0,  0,  0,  0,  0,  0,  0],
+    'n': [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50],
+    'b': [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20],
+    'r': [
+          0,  0,  0,  0,  0,  0,  0,  0,
+          5, 10, 10, 10, 10, 10, 10,  5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+          0,  0,  0,  5,  5,  0,  0,  0],
+    'q': [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20],
+    'k': [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20],
+}
+# King table once the queens are off / little material is left
+KING_ENDGAME = [
+    -50,-40,-30,-20,-20,-30,-40,-50,
+    -30,-20,-10,  0,  0,-10,-20,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-30,  0,  0,  0,  0,-30,-30,
+    -50,-30,-30,-30,-30,-30,-30,-50]
+
+# Non-pawn material (both sides) at or below which KING_ENDGAME is used
+ENDGAME_MATERIAL = 2 * PIECE_VALUES['r'] + 2 * PIECE_VALUES['b']
+
+# Per piece letter, value + table bonus for each square, from that piece's owner's side
+PIECE_SQUARE = {}
+for _p,_table in PST.items():
+    PIECE_SQUARE[_p.upper()] = [PIECE_VALUES[_p] + _table[sq] for sq in range(64)]
+    PIECE_SQUARE[_p] = [PIECE_VALUES[_p] + _table[sq ^ 56] for sq in range(64)]
+KING_ENDGAME_SQUARE = {'K': KING_ENDGAME[:], 'k': [KING_ENDGAME[sq ^ 56] for sq in range(64)]}
+
+def _squares(bb):
+    while bb:
+        b = bb & -bb
+        yield b.bit_length()-1
+        bb ^= b
+
+def evaluate(board):
+    # Score in centipawns from the side to move's point of view, in O(1) from the material and
+    # piece-square terms the board keeps up to date in make_code/unmake_code (kings excluded)
+    bb = board.bitboards
+    material, psq = board.material, board.psq
+    score = psq['w'] - psq['b']
+    heavy = material['w'] + material['b'] - PIECE_VALUES['p'] * bin(bb['P'] | bb['p']).count('1')
+    kings = KING_ENDGAME_SQUARE if heavy <= ENDGAME_MATERIAL else PIECE_SQUARE
+    if bb['K']: score += kings['K'][bb['K'].bit_length()-1]
+    if bb['k']: score -= kings['k'][bb['k'].bit_length()-1]
+    return score if board.turn=='w' else -score
+
+def evaluate_full(board):
+    # Same score recomputed from the bitboards (reference for evaluate)
+    bb = board.bitboards
+    score = 0
+    heavy = 0
+    for p in 'PNBRQpnbrq':
+        table = PIECE_SQUARE[p]
+        s = 0
+        for sq in _squares(bb[p]):
+            s += table[sq]
+        if p.isupper(): score += s
+        else: score -= s
+        if p not in 'Pp': heavy += PIECE_VALUES[p.lower()] * bin(bb[p]).count('1')
+    kings = KING_ENDGAME_SQUARE if heavy <= ENDGAME_MATERIAL else PIECE_SQUARE
+    if bb['K']: score += kings['K'][bb['K'].bit_length()-1]
+    if bb['k']: score -= kings['k'][bb['k'].bit_length()-1]
+    return score if board.turn=='w' else -score
@@ -0,0 +1,310 @@
+# gamedb.py - game database: compact binary game records plus a position-hash index, memory-mapped
+#
+#   python gamedb.py build games.pgn selfplay_games.jsonl -o games.db
+#   python gamedb.py stats games.db [--fen FEN]        # moves played from a position, with their results
+#   python gamedb.py find games.db [--fen FEN] [-n 20]  # games that reached a position
+#   python gamedb.py show games.db 17                   # one game as PGN
+#
+# File layout (little-endian):
+#   header   <magic 8s><games u32><offsets position u64><index position u64><index entries u64>
+#   games    per game <result u8><plies u16><tags length u16>, the tags as JSON, then one packed u16 move per ply
+#   offsets  file position of every game record, u64
+#   index    17-byte entries <hash u64><game u32><ply u16><move u16><result u8> sorted by (hash, game, ply),
+#            one for every position a game reached; move is the one played from it (0 after the last ply)
+# Import streams: records go straight to the file and index entries are sorted in chunks (runs in a
+# temporary directory) and merged at the end. Lookups are a binary search on the mmap of the index.
+import argparse
+import datetime
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+from engine import Board, WHITE
+
+MAGIC = b'CHSGDB01'
+HEADER = struct.Struct('<8sIQQQ')
+RECORD = struct.Struct('<BHH')
+OFFSET = struct.Struct('<Q')
+ENTRY = struct.Struct('<QIHHB')
+RESULTS = ['*', '1-0', '0-1', '1/2-1/2']
+STATS_COLUMN = {'1-0': 1, '1/2-1/2': 2, '0-1': 3}
+TAG_ORDER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+
+class GameDatabase:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path}: not a game database")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._offsets, self._index, self.entries = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or self._index + self.entries * ENTRY.size != size:
+            self.close()
+            raise ValueError(f"{path}: not a game database")
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, i):
+        return struct.unpack_from('<Q', self._mm, self._index + i * ENTRY.size)[0]
+
+    def find(self, key):
+        # [(game, ply, packed move played there or 0, result)] for every time a game reached the position hash
+        lo, hi = 0, self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key: lo = mid + 1
+            else: hi = mid
+        found = []
+        while lo < self.entries:
+            h, game, ply, move, result = ENTRY.unpack_from(self._mm, self._index + lo * ENTRY.size)
+            if h != key: break
+            found.append((game, ply, move, RESULTS[result]))
+            lo += 1
+        return found
+
+    def games(self, key):
+        # numbers of the games that reached the position (once each, first occurrence's ply)
+        seen = {}
+        for game, ply, _, _ in self.find(key):
+            seen.setdefault(game, ply)
+        return seen
+
+    def move_stats(self, key):
+        # {packed move: [games, white wins, draws, black wins]} over the games that reached the position;
+        # a game counts for the move it played the first time it got there
+        stats = {}
+        last = None
+        for game, _, move, result in self.find(key):
+            if game == last: continue
+            last = game
+            if move == 0: continue
+            s = stats.setdefault(move, [0, 0, 0, 0])
+            s[0] += 1
+            if result != '*': s[STATS_COLUMN[result]] += 1
+        return stats
+
+    def game(self, number):
+        # {'tags', 'result', 'moves' (packed)} of game number (0-based)
+        if not 0 <= number < self.count: raise IndexError(f"game {number} not in database")
+        pos = OFFSET.unpack_from(self._mm, self._offsets + number * OFFSET.size)[0]
+        result, plies, tag_len = RECORD.unpack_from(self._mm, pos)
+        pos += RECORD.size
+        tags = json.loads(self._mm[pos:pos + tag_len].decode('utf-8'))
+        pos += tag_len
+        moves = list(struct.unpack_from(f'<{plies}H', self._mm, pos))
+        return {'tags': tags, 'result': RESULTS[result], 'moves': moves}
+
+    def board(self, number, ply=None):
+        # Board of game number after ply moves (default: the final position)
+        g = self.game(number)
+        board = Board(g['tags']['FEN']) if 'FEN' in g['tags'] else Board()
+        for code in g['moves'][:ply]:
+            board.make_code(code)
+        return board
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Reading games: (tags, moves as text, result) from PGN or selfplay.py JSON lines ---
+_PGN_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|[()]|[^\s(){};]+')
+_MOVE_NUMBER = re.compile(r'^\d+\.+')
+_TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+_UCI = re.compile(r'^[a-h][1-8][a-h][1-8][nbrq]?$')
+
+def read_pgn(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        tags, movetext = {}, []
+        for line in f:
+            line = line.strip()
+            if line.startswith('[') and not line.startswith('[%'):
+                if movetext:
+                    yield _pgn_game(tags, movetext)
+                    tags, movetext = {}, []
+                m = _TAG.match(line)
+                if m: tags[m.group(1)] = m.group(2).replace('\\"', '"')
+            elif line and not line.startswith('%'):
+                movetext.append(line)
+        if tags or movetext:
+            yield _pgn_game(tags, movetext)
+
+def _pgn_game(tags, movetext):
+    # main line SAN moves; comments, NAGs and variations are dropped
+    moves = []
+    result = tags.get('Result', '*')
+    depth = 0
+    for token in _PGN_TOKEN.findall('\n'.join(movetext)):
+        if token == '(': depth += 1
+        elif token == ')': depth -= 1
+        elif depth or token[0] in '{;$': continue
+        elif token in RESULTS: result = token
+        else:
+            token = _MOVE_NUMBER.sub('', token)
+            if token: moves.append(token)
+    return tags, moves, result
+
+def read_selfplay(path):
+    with open(path) as f:
+        for line in f:
+            if not line.strip(): continue
+            record = json.loads(line)
+            tags = {'Event': 'selfplay', 'Round': str(record['game']), 'White': record['white'],
+                    'Black': record['black'], 'Result': record['result'], 'Termination': record['reason']}
+            yield tags, record['moves'], record['result']
+
+def read_games(path):
+    return read_selfplay(path) if path.endswith(('.jsonl', '.json')) else read_pgn(path)
+
+# --- Writing PGN (the client saves its games this way) ---
+def pgn_text(tags, codes, result):
+    board = Board(tags['FEN']) if 'FEN' in tags else Board()
+    tags = dict(tags, Result=result)
+    lines = [f'[{k} "{tags[k]}"]' for k in TAG_ORDER if k in tags]
+    lines += [f'[{k} "{v}"]' for k, v in tags.items() if k not in TAG_ORDER]
+    words = []
+    for code in codes:
+        if board.turn == WHITE: words.append(f"{board.fullmove_number}.")
+        elif not words: words.append(f"{board.fullmove_number}...")
+        words.append(board.san(code))
+        board.make_code(code)
+    words.append(result)
+    text, line = [], ''
+    for w in words:
+        if line and len(line) + 1 + len(w) > 79:
+            text.append(line); line = w
+        else:
+            line = f"{line} {w}" if line else w
+    text.append(line)
+    return '\n'.join(lines) + '\n\n' + '\n'.join(text) + '\n\n'
+
+def append_pgn(path, board, result, tags=None):
+    # add the game played on board (from the start position) to a PGN file
+    tags = dict(tags or {})
+    tags.setdefault('Date', datetime.date.today().strftime('%Y.%m.%d'))
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(pgn_text(tags, [m.code for m in board.move_stack], result))
+
+# --- Building ---
+def _replay(tags, moves):
+    # packed moves of the game, up to the first move the engine can't play (e.g. en passant)
+    board = Board(tags['FEN']) if 'FEN' in tags else Board()
+    codes, hashes = [], []
+    for text in moves:
+        move = board.move_from_uci(text) if _UCI.match(text) else board.parse_san(text)
+        if move is None: break
+        hashes.append(board.hash)
+        codes.append(move.code)
+        board.make_code(move.code)
+    hashes.append(board.hash)
+    return codes, hashes
+
+def _write_run(entries, directory, runs):
+    entries.sort()
+    path = os.path.join(directory, f"run{len(runs)}.bin")
+    with open(path, 'wb') as f:
+        f.write(b''.join(ENTRY.pack(*e) for e in entries))
+    runs.append(path)
+    entries.clear()
+
+def _read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(ENTRY.size * 65536)
+            if not data: return
+            yield from ENTRY.iter_unpack(data)
+
+def build(paths, out_path, chunk=1 << 20, progress=None):
+    # Stream the games of PGN / selfplay JSON lines files into a database; returns (games, positions, truncated)
+    games = positions = truncated = 0
+    offsets = []
+    entries = []
+    runs = []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as tmp, open(out_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+        for path in paths:
+            for tags, moves, result in read_games(path):
+                try:
+                    codes, hashes = _replay(tags, moves)
+                except ValueError:
+                    continue   # bad FEN tag
+                if len(codes) < len(moves): truncated += 1
+                result = RESULTS.index(result) if result in RESULTS else 0
+                tag_bytes = json.dumps(tags, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                if len(tag_bytes) > 0xFFFF:
+                    tag_bytes = json.dumps({k: tags[k] for k in TAG_ORDER + ['FEN'] if k in tags}).encode('utf-8')
+                offsets.append(out.tell())
+                out.write(RECORD.pack(result, len(codes), len(tag_bytes)) + tag_bytes + struct.pack(f'<{len(codes)}H', *codes))
+                for ply, h in enumerate(hashes):
+                    entries.append((h, games, ply, codes[ply] if ply < len(codes) else 0, result))
+                positions += len(hashes)
+                games += 1
+                if len(entries) >= chunk: _write_run(entries, tmp, runs)
+                if progress and games % 1000 == 0: progress(games, positions)
+        entries.sort()
+        offsets_pos = out.tell()
+        out.write(b''.join(OFFSET.pack(o) for o in offsets))
+        index_pos = out.tell()
+        block = []
+        for e in heapq.merge(entries, *(_read_run(p) for p in runs)):
+            block.append(ENTRY.pack(*e))
+            if len(block) >= 65536:
+                out.write(b''.join(block)); block = []
+        out.write(b''.join(block))
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, games, offsets_pos, index_pos, positions))
+    return games, positions, truncated
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the game database")
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('build', help="import games into a new database")
+    b.add_argument('games', nargs='+', help="PGN files and selfplay.py JSON lines files (.jsonl)")
+    b.add_argument('-o', '--output', default='games.db')
+    for name, text in (('stats', "moves played from a position"), ('find', "games that reached a position")):
+        q = sub.add_parser(name, help=text)
+        q.add_argument('db')
+        q.add_argument('--fen')
+        q.add_argument('-n', type=int, default=20, help="list at most this many games")
+    show = sub.add_parser('show', help="print a game as PGN")
+    show.add_argument('db')
+    show.add_argument('game', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        games, positions, truncated = build(args.games, args.output,
+                                            progress=lambda g, p: print(f"\r{g} games, {p} positions", end='', flush=True))
+        print(f"\r{args.output}: {games} games, {positions} positions indexed"
+              + (f", {truncated} games cut at a move the engine can't play" if truncated else ""))
+        return
+    with GameDatabase(args.db) as db:
+        if args.command == 'show':
+            g = db.game(args.game)
+            print(pgn_text(g['tags'], g['moves'], g['result']), end='')
+            return
+        board = Board(args.fen) if args.fen else Board()
+        if args.command == 'stats':
+            stats = db.move_stats(board.hash)
+            for move, (n, w, d, l) in sorted(stats.items(), key=lambda kv: -kv[1][0]):
+                print(f"{board.san(move):<8} {n:>7} games  +{w} ={d} -{l}")
+            if not stats: print("position not found")
+        else:
+            found = db.games(board.hash)
+            for game, ply in list(found.items())[:args.n]:
+                g = db.game(game)
+                print(f"#{game:<7} ply {ply:<4} {g['tags'].get('White', '?')} - {g['tags'].get('Black', '?')}  {g['result']}")
+            print(f"{len(found)} games")
+
+if __name__ == "__main__":
+    main()
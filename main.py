@@ -1,7 +1,10 @@
 import pygame
 import sys
-import random
 from engine import Board
+from ai_worker import BackgroundSearch
+from book import OpeningBook
+from tablebase import Tablebases
+from gamedb import append_pgn
 
 # --- CẤU HÌNH  ---
 WIDTH = 768    
@@ -11,7 +14,13 @@ MOVES_LOG_FONT = None
 TITLE_FONT = None
 DIMENSION = 8          
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15
+AI_POLL_MS = 100       # chu kỳ thức dậy (ms) khi AI đang nghĩ: lấy kết quả + chấm "thinking..."
+AI_THINK_TIME = 0.5    # giây suy nghĩ cho mỗi nước của AI (PvAI)
+AI_DEMO_TIME = 0.2     # AI vs AI
+AI_WORKERS = 1         # số process tìm kiếm song song (Lazy SMP) cho AI
+BOOK_PATH = "book.bin" # opening book (python book.py build ...), bỏ qua nếu không có
+LOG_ROWS = 10           # số dòng Move History hiện cùng lúc (2 nước/dòng), cuộn chuột để xem cả ván
+GAMES_PGN = "games.pgn" # ván đã chơi được ghi thêm vào đây (python gamedb.py build games.pgn ...), None = không ghi
 IMAGES = {}
 
 class Theme:
@@ -51,14 +60,18 @@ class Button:
         self.hover_color = hover_color if hover_color else self.lighten_color(color)
         self.text_color = text_color
         self.font = font if font else pygame.font.SysFont('Arial', 20)
+        # chữ chỉ render một lần
+        self.text_surf = self.font.render(self.text, True, self.text_color)
+
+    def is_hovered(self):
+        return self.rect.collidepoint(pygame.mouse.get_pos())
 
     def lighten_color(self, color, amount=Theme.BTN_HOVER):
         return tuple(min(c + amount, 255) for c in color)
 
     def draw(self, screen):
         # Hover
-        mouse_pos = pygame.mouse.get_pos()
-        current_color = self.hover_color if self.rect.collidepoint(mouse_pos) else self.base_color
+        current_color = self.hover_color if self.is_hovered() else self.base_color
 
         # Shadow
         shadow_rect = pygame.Rect(self.rect.x + 3, self.rect.y + 3, self.rect.width, self.rect.height)
@@ -69,9 +82,8 @@ class Button:
         pygame.draw.rect(screen, (200, 200, 200), self.rect, 2, border_radius=8) # Viền đen
 
         # Ghi chữ
-        text_surf = self.font.render(self.text, True, self.text_color)
-        text_rect = text_surf.get_rect(center=self.rect.center)
-        screen.blit(text_surf, text_rect)
+        text_rect = self.text_surf.get_rect(center=self.rect.center)
+        screen.blit(self.text_surf, text_rect)
 
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
@@ -82,7 +94,6 @@ class ChessMain:
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Chess UI - Group Project Mockup")
-        self.clock = pygame.time.Clock()
         self.gs = Board()
         self.game_state = "MENU" # MENU, PLAYING
         self.game_mode = "PvP"   # PvP, PvAI, AIvAI
@@ -93,10 +104,24 @@ class ChessMain:
         self.MOVES_LOG_FONT = pygame.font.SysFont("Consolas", 14, False, False)
         self.PANEL_FONT = pygame.font.SysFont("Arial", 18, True, False)
         self.TURN_FONT = pygame.font.SysFont("Arial", 24, True, False)
+        self.GAME_OVER_FONT = pygame.font.SysFont("Arial", 32, True, False)
         
         # Load ảnh quân cờ
         self.load_images()
 
+        # Cache cho việc vẽ: nền bàn cờ vẽ sẵn, lớp highlight, chữ đã render (key = font, nội dung, màu)
+        self.board_bg = self.render_board_background()
+        self.overlays = {}
+        for name, color in (('selected', Theme.H_SELECTED), ('valid', Theme.H_VALID_MOVE),
+                            ('last', Theme.H_LAST_MOVE), ('check', Theme.H_CHECK)):
+            s = pygame.Surface((SQ_SIZE, SQ_SIZE))
+            s.set_alpha(100)
+            s.fill(color)
+            self.overlays[name] = s
+        self.text_cache = {}
+        # Những gì đang hiện trên màn hình, để chỉ vẽ lại vùng thay đổi (dirty rects)
+        self.invalidate()
+
         # Khởi tạo Buttons
         btn_width = 200
         btn_height = 50
@@ -119,6 +144,21 @@ class ChessMain:
         self.selected_square = () # (row, col) người dùng vừa click
         self.valid_moves = []     # Danh sách ô có thể đi từ ô đã chọn
 
+        # AI chạy ở process nền, UI vẫn vẽ và nhận sự kiện trong lúc AI suy nghĩ
+        self.ai = BackgroundSearch(AI_WORKERS)
+        self.book = OpeningBook.open_if_exists(BOOK_PATH)
+        # Tablebase tàn cuộc 3 quân (python tablebase.py generate), tra O(1) qua mmap
+        self.tablebases = Tablebases()
+
+        # Kết thúc ván: chỉ kiểm tra lại khi thế cờ đổi
+        self.checked_position = None
+        self.game_over_text = None
+        self.game_saved = False
+
+        # Move History: mỗi dòng (1 lượt Trắng + Đen) render một lần khi có nước mới
+        self.move_log = []
+        self.log_scroll = 0   # số dòng cuộn ngược lên từ cuối log
+
     def load_images(self):
         pieces = ['wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bP', 'bR', 'bN', 'bB', 'bQ', 'bK']
         for piece in pieces:
@@ -128,132 +168,156 @@ class ChessMain:
             except FileNotFoundError:
                 print(f"Warning: Không tìm thấy file ảnh images/{piece}.png")
 
+    def render_text(self, font, text, color):
+        # Surface chữ lấy từ cache, chỉ render khi gặp nội dung mới
+        key = (id(font), text, tuple(color))
+        surf = self.text_cache.get(key)
+        if surf is None:
+            if len(self.text_cache) > 512: self.text_cache.clear()
+            surf = self.text_cache[key] = font.render(text, True, color)
+        return surf
+
+    def invalidate(self):
+        # Quên trạng thái đã vẽ -> frame sau vẽ lại toàn bộ (sau popup, game over, đổi màn hình)
+        self.drawn_squares = [None] * (DIMENSION * DIMENSION)
+        self.drawn_panel = None
+        self.drawn_menu = None
+        self.drawn_game_over = False
+
     def draw_menu(self):
+        # Trả về danh sách vùng đã vẽ lại
+        key = (self.btn_pvp.is_hovered(), self.btn_minimax.is_hovered(), self.btn_ai_ai.is_hovered())
+        if key == self.drawn_menu:
+            return []
+        self.invalidate()
+        self.drawn_menu = key
         self.screen.fill(Theme.BG_MAIN)
         # Title
-        title = self.TITLE_FONT.render("CHESS AI PROJECT", True, Theme.TEXT_MAIN)
+        title = self.render_text(self.TITLE_FONT, "CHESS AI PROJECT", Theme.TEXT_MAIN)
         self.screen.blit(title, (WIDTH//2 - 200, 65))
 
         # Buttons
         self.btn_pvp.draw(self.screen)
         self.btn_minimax.draw(self.screen)
         self.btn_ai_ai.draw(self.screen)
+        return [self.screen.get_rect()]
 
-    # Vẽ bàn cờ
-    def draw_board(self):
+    # Nền bàn cờ, vẽ một lần
+    def render_board_background(self):
+        bg = pygame.Surface((HEIGHT, HEIGHT))
         colors = [Theme.BOARD_LIGHT, Theme.BOARD_DARK]
         for r in range(DIMENSION):
             for c in range(DIMENSION):
                 color = colors[((r + c) % 2)]
-                pygame.draw.rect(self.screen, color, pygame.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+                pygame.draw.rect(bg, color, pygame.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+        return bg
 
-    def highlight_squares(self):
+    def square_highlights(self):
+        # {(row, col): [tên lớp highlight theo thứ tự vẽ]}
+        marks = {}
         if self.selected_square != ():
-            r, c = self.selected_square
-            
-            # Tô màu ô chọn
-            s = pygame.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(Theme.H_SELECTED)
-            self.screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-
-            # Các ô đi được
-            s.fill(Theme.H_VALID_MOVE)
+            # ô chọn và các ô đi được
+            marks.setdefault(self.selected_square, []).append('selected')
             for move in self.valid_moves:
-                target_r, target_c = move.to_sq 
-                self.screen.blit(s, (target_c * SQ_SIZE, target_r * SQ_SIZE))
+                marks.setdefault(move.to_sq, []).append('valid')
 
-        # Highlight Last Move
+        # Highlight Last Move (ô đi và ô đến)
         if len(self.gs.move_stack) > 0:
-            last_move = self.gs.move_stack[-1][0] # Lấy Move object cuối cùng
-            
-            s = pygame.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(Theme.H_LAST_MOVE) 
-            
-            # Highlight ô đi và ô đến
-            start_r, start_c = last_move.from_sq
-            end_r, end_c = last_move.to_sq
-            self.screen.blit(s, (start_c*SQ_SIZE, start_r*SQ_SIZE))
-            self.screen.blit(s, (end_c*SQ_SIZE, end_r*SQ_SIZE))
-
-        # Highlight Check
-        if self.gs.is_in_check(self.gs.turn):
+            last_move = self.gs.move_stack[-1] # Move object cuối cùng
+            marks.setdefault(last_move.from_sq, []).append('last')
+            marks.setdefault(last_move.to_sq, []).append('last')
+
+        # Highlight Check (cache theo thế cờ, không tính lại mỗi frame)
+        if self.gs.in_check():
             # Tìm vua của phe đang bị chiếu
             king_pos = self.gs.find_king(self.gs.turn)
             if king_pos:
-                kr, kc = king_pos
-                s = pygame.Surface((SQ_SIZE, SQ_SIZE))
-                s.set_alpha(100)
-                s.fill(Theme.H_CHECK) 
-                self.screen.blit(s, (kc*SQ_SIZE, kr*SQ_SIZE))
+                marks.setdefault(king_pos, []).append('check')
+        return marks
 
-    # Vẽ quân cờ
-    def draw_pieces(self, board):
+    # Vẽ bàn cờ: chỉ những ô có quân / highlight khác frame trước
+    def draw_board(self):
+        dirty = []
+        board = self.gs.board
+        marks = self.square_highlights()
         for r in range(DIMENSION):
             for c in range(DIMENSION):
-                piece = board[r][c]
-                
-                if piece != '.': 
-                    if piece.isupper():
-                        color = 'w'
-                        type_ = piece
-                    else:
-                        color = 'b'
-                        type_ = piece.upper()
-                    
-                    image_key = color + type_
-                    
-                    if image_key in IMAGES:
-                         self.screen.blit(IMAGES[image_key], pygame.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-    # Chuyển đổi Object Move thành chuỗi hiển thị
+                key = (board[r][c], tuple(marks.get((r, c), ())))
+                i = r * DIMENSION + c
+                if self.drawn_squares[i] == key: continue
+                self.drawn_squares[i] = key
+                rect = pygame.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                self.screen.blit(self.board_bg, rect, rect)
+                for name in key[1]:
+                    self.screen.blit(self.overlays[name], rect)
+                self.draw_piece(key[0], rect)
+                dirty.append(rect)
+        return dirty
+
+    # Vẽ quân cờ
+    def draw_piece(self, piece, rect):
+        if piece != '.':
+            image_key = ('w' if piece.isupper() else 'b') + piece.upper()
+            if image_key in IMAGES:
+                self.screen.blit(IMAGES[image_key], rect)
+
+    # Chuyển đổi Object Move thành chuỗi hiển thị (SAN, tính sẵn lúc đi nước)
     def get_move_str(self, move_obj):
-        return str(move_obj)
-        # Option 2
-        r1, c1 = move_obj.from_sq
-        r2, c2 = move_obj.to_sq
-        files = ['a','b','c','d','e','f','g','h']
-        cols = ['8','7','6','5','4','3','2','1']
-        start = files[c1] + cols[r1]
-        end = files[c2] + cols[r2]
-        return f"{start}-{end}"
+        return move_obj.san or str(move_obj)
+
+    # Đi một nước: SAN được tính một lần ở đây rồi lưu trong Move
+    def play_move(self, move):
+        self.gs.apply_move(move, with_san=True)
+        self.update_move_log()
+
+    def undo_move(self):
+        self.gs.undo_move()
+        self.update_move_log()
+
+    def update_move_log(self):
+        # Chỉ dòng cuối của log thay đổi khi đi / undo một nước -> chi phí không tăng theo độ dài ván
+        moves_list = self.gs.move_stack
+        rows = (len(moves_list) + 1) // 2
+        del self.move_log[rows:]
+        if rows:
+            i = (rows - 1) * 2
+            str_w = self.get_move_str(moves_list[i])
+            str_b = self.get_move_str(moves_list[i+1]) if i + 1 < len(moves_list) else ""
+            text = f"{f'{rows}.':<3} {str_w:<7} {str_b:<7}"
+            surf = self.MOVES_LOG_FONT.render(text, True, (255, 255, 255))
+            if rows > len(self.move_log): self.move_log.append(surf)
+            else: self.move_log[-1] = surf
+        self.log_scroll = 0 # có nước mới -> về cuối log
+
+    def scroll_move_log(self, rows):
+        # rows > 0: cuộn lên (nước cũ hơn)
+        self.log_scroll = min(max(self.log_scroll + rows, 0), max(len(self.move_log) - LOG_ROWS, 0))
 
     def draw_move_log(self):
         log_x = HEIGHT + 25
         log_y = 124
         line_height = 20
         
-        title = self.MOVES_LOG_FONT.render("Move History:", True, Theme.TEXT_LOG)
+        title = self.render_text(self.MOVES_LOG_FONT, "Move History:", Theme.TEXT_LOG)
         self.screen.blit(title, (log_x, log_y - 25))
 
-        # move_stack chứa tuple (Move, prev_state). chỉ lấy Move.
-        moves_list = [m[0] for m in self.gs.move_stack]
-
-        # Chỉ hiện 20 nước cuối
-        start_index = 0
-        if len(moves_list) > 20:
-            start_index = len(moves_list) - 20
+        # Chỉ vẽ LOG_ROWS dòng đang hiện (mặc định là cuối ván)
+        end = len(self.move_log) - self.log_scroll
+        start = max(end - LOG_ROWS, 0)
+        if len(self.move_log) > LOG_ROWS:
+            pos = self.render_text(self.MOVES_LOG_FONT, f"{start + 1}-{end}/{len(self.move_log)}", Theme.TEXT_SUB)
+            self.screen.blit(pos, (HEIGHT + PANEL_WIDTH - 25 - pos.get_width(), log_y - 25))
 
-        for i in range(start_index, len(moves_list), 2):
-            move_num = i // 2 + 1
-            text_num = f"{move_num}."
-            
-            # Nước Trắng
-            white_move = moves_list[i]
-            str_w = self.get_move_str(white_move)
-            
-            # Nước Đen
-            str_b = ""
-            if i + 1 < len(moves_list):
-                black_move = moves_list[i+1]
-                str_b = self.get_move_str(black_move)
-            
-            text = f"{text_num:<3} {str_w:<7} {str_b:<7}"
-            text_object = self.MOVES_LOG_FONT.render(text, True, pygame.Color("white"))
+        for text_object in self.move_log[start:end]:
             self.screen.blit(text_object, (log_x, log_y))
             log_y += line_height
 
+    def panel_key(self):
+        # Tất cả những gì panel hiển thị; panel chỉ vẽ lại khi key đổi
+        thinking = pygame.time.get_ticks() // 300 % 4 if self.ai.busy else None
+        return (self.gs.turn, self.tablebases.probe(self.gs), thinking, len(self.gs.move_stack), self.gs.hash, self.log_scroll,
+                self.btn_undo.is_hovered(), self.btn_reset.is_hovered())
+
     def draw_side_panel(self):
         # Nền panel
         panel_rect = pygame.Rect(HEIGHT, 0, PANEL_WIDTH, HEIGHT)
@@ -264,16 +328,30 @@ class ChessMain:
         pygame.draw.rect(self.screen, Theme.BG_CARD, status_card_rect, border_radius=5)
         
         # Tiêu đề Card
-        title_surf = self.PANEL_FONT.render("GAME STATUS", True, Theme.TEXT_SUB)
+        title_surf = self.render_text(self.PANEL_FONT, "GAME STATUS", Theme.TEXT_SUB)
         self.screen.blit(title_surf, (HEIGHT + 23, 30))
         
         # Nội dung Status (Turn)
         status_text = "White's Turn" if self.gs.turn == 'w' else "Black's Turn"
         status_color = (255, 255, 255) if self.gs.turn == 'w' else (255, 100, 100)
         
-        turn_surf = self.TURN_FONT.render(status_text, True, status_color)
+        turn_surf = self.render_text(self.TURN_FONT, status_text, status_color)
         self.screen.blit(turn_surf, (HEIGHT + 23, 60))
 
+        # Kết quả tablebase (nếu thế cờ còn <= 3 quân)
+        tb = self.tablebases.probe(self.gs)
+        if tb is not None and tb[0] != 'draw':
+            side = self.gs.turn if tb[0] == 'win' else ('b' if self.gs.turn == 'w' else 'w')
+            tb_text = f"{'White' if side == 'w' else 'Black'} mates in {(tb[1] + 1) // 2}"
+            tb_surf = self.render_text(self.PANEL_FONT, tb_text, Theme.TEXT_SUB)
+            self.screen.blit(tb_surf, (HEIGHT + PANEL_WIDTH - 23 - tb_surf.get_width(), 30))
+
+        # Đang suy nghĩ
+        if self.ai.busy:
+            dots = "." * (pygame.time.get_ticks() // 300 % 4)
+            thinking_surf = self.render_text(self.PANEL_FONT, f"AI is thinking{dots}", Theme.TEXT_SUB)
+            self.screen.blit(thinking_surf, (HEIGHT + 23, 330 - thinking_surf.get_height()))
+
         # Move Log
         self.draw_move_log()
         
@@ -282,10 +360,14 @@ class ChessMain:
         self.btn_reset.draw(self.screen)
 
     def draw_gamestate(self):
-        self.draw_board()
-        self.highlight_squares()
-        self.draw_pieces(self.gs.board)
-        self.draw_side_panel()
+        # Vẽ lại phần thay đổi, trả về danh sách vùng cần update lên màn hình
+        dirty = self.draw_board()
+        key = self.panel_key()
+        if key != self.drawn_panel:
+            self.drawn_panel = key
+            self.draw_side_panel()
+            dirty.append(pygame.Rect(HEIGHT, 0, PANEL_WIDTH, HEIGHT))
+        return dirty
 
     """
     Popup chọn quân phong cấp
@@ -320,234 +402,265 @@ class ChessMain:
             if image_key in IMAGES:
                 self.screen.blit(IMAGES[image_key], rect)
 
-        pygame.display.flip() 
+        pygame.display.update(pygame.Rect(popup_x - 5, popup_y - 5, popup_width + 10, popup_height + 10))
 
         waiting = True
         selected_piece = 'Q' # Mặc định là Q nếu lỗi
 
         while waiting:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                    
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    location = pygame.mouse.get_pos()
-                    for rect, code in choice_rects:
-                        if rect.collidepoint(location):
-                            selected_piece = code
-                            waiting = False 
-                            
-            self.clock.tick(MAX_FPS)
-        
+            event = pygame.event.wait() # ngủ tới khi có input
+            if event.type == pygame.QUIT:
+                self.save_game()
+                pygame.quit()
+                sys.exit()
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                for rect, code in choice_rects:
+                    if rect.collidepoint(event.pos):
+                        selected_piece = code
+                        waiting = False
+
+        # popup đã che bàn cờ -> vẽ lại toàn bộ
+        self.invalidate()
         return selected_piece
     
     def execute_ai_move(self):
-        # Tạm thời dùng Random Move để test UI. 
-        valid_moves = self.gs.get_valid_moves()
-        
-        if not valid_moves:
-            return 
-        
-        ai_move = None
-        
-        if self.game_mode == "PvAI":
-            # Giả sử đây là chỗ của Minimax sau này. Tạm thời: Random
-            print("AI (Minimax Placeholder) đang suy nghĩ...")
-            pygame.time.delay(500) 
-            ai_move = random.choice(valid_moves)
-            
-        elif self.game_mode == "AIvAI":
-            pygame.time.delay(100) 
-            ai_move = random.choice(valid_moves)
+        # Alpha-beta + iterative deepening (search.py) ở process nền; gọi mỗi frame, không chặn UI
+        if not self.ai.busy:
+            if self.game_over_text or self.gs.game_status() is not None:
+                return
+            # Tra opening book trước khi tìm kiếm
+            book_move = self.book.choose(self.gs) if self.book else None
+            if book_move:
+                self.play_move(book_move)
+                print(f"AI Moved: {book_move} (book)")
+                self.valid_moves = []
+                self.selected_square = ()
+                return
+            if self.game_mode == "PvAI":
+                print("AI (Minimax) đang suy nghĩ...")
+                self.ai.start(self.gs, AI_THINK_TIME)
+            elif self.game_mode == "AIvAI":
+                self.ai.start(self.gs, AI_DEMO_TIME)
+            return
+
+        result = self.ai.poll(self.gs)
+        if result is None:
+            return # chưa xong
+        ai_move = result.move
             
         if ai_move:
-            self.gs.apply_move(ai_move)
-            print(f"AI Moved: {ai_move}")
+            self.play_move(ai_move)
+            print(f"AI Moved: {ai_move} (depth {result.depth}, score {result.score}, {result.nodes} nodes)")
             # Reset trạng thái animation/highlight
             self.valid_moves = [] 
             self.selected_square = ()
 
-    # Vòng lặp chính
+    def is_ai_turn(self):
+        if self.game_state != "PLAYING" or self.game_over_text: return False
+        return self.game_mode == "AIvAI" or (self.game_mode == "PvAI" and self.gs.turn == 'b')
+
+    def wait_timeout(self):
+        # Thời gian chờ sự kiện tối đa (ms): None = ngủ tới khi có input, 0 = không chờ
+        if self.ai.busy: return AI_POLL_MS
+        if self.is_ai_turn(): return 0
+        return None
+
+    def check_game_over(self):
+        # Chỉ tính lại sau apply_move/undo_move/ván mới (key của thế cờ đổi)
+        key = (id(self.gs), len(self.gs.move_stack), self.gs.hash)
+        if key == self.checked_position: return
+        self.checked_position = key
+        self.game_over_text = None
+        self.drawn_game_over = False
+
+        status = self.gs.game_status() # cache theo thế cờ
+        result = '1/2-1/2'
+        if status == 'checkmate':
+            winner = "Black" if self.gs.turn == 'w' else "White"
+            self.game_over_text = f"{winner} Wins by Checkmate!"
+            result = '0-1' if self.gs.turn == 'w' else '1-0'
+        elif status == 'stalemate':
+            self.game_over_text = "Draw by Stalemate!"
+        elif self.tablebases.probe(self.gs) == ('draw', 0):
+            # tàn cuộc hòa lý thuyết (vua trơ, KBK, KNK, KPK hòa)
+            self.game_over_text = "Draw (Tablebase)!"
+        if self.game_over_text:
+            self.ai.cancel() # hết ván: bỏ tìm kiếm đang chạy (nếu có), UI được ngủ
+            self.save_game(result)
+
+    def save_game(self, result='*'):
+        # Ghi ván vào GAMES_PGN (mỗi ván một lần); ván dở dang có kết quả '*'
+        if not GAMES_PGN or self.game_saved or not self.gs.move_stack: return
+        players = {"PvP": ("Player", "Player"), "PvAI": ("Player", "Minimax"), "AIvAI": ("AI", "AI")}[self.game_mode]
+        try:
+            append_pgn(GAMES_PGN, self.gs, result, {'Event': f"Chess {self.game_mode}", 'White': players[0], 'Black': players[1]})
+        except OSError as e:
+            print(f"Không ghi được ván vào {GAMES_PGN}: {e}")
+        self.game_saved = True
+
+    def draw_game_over(self):
+        # Vẽ thông báo giữa màn hình, trả về vùng đã vẽ
+        text_surf = self.render_text(self.GAME_OVER_FONT, self.game_over_text, pygame.Color('red'))
+        text_rect = text_surf.get_rect(center=(WIDTH//2, HEIGHT//2))
+
+        # Viền background
+        bg_rect = text_rect.inflate(20, 20)
+        pygame.draw.rect(self.screen, pygame.Color('black'), bg_rect)
+        pygame.draw.rect(self.screen, pygame.Color('white'), bg_rect, 2)
+
+        self.screen.blit(text_surf, text_rect)
+        self.drawn_game_over = True
+        return bg_rect
+
+    def new_game(self, mode=None):
+        # mode=None: về menu
+        self.ai.cancel()
+        if self.game_state == "PLAYING": self.save_game()
+        self.gs = Board()
+        self.game_saved = False
+        self.update_move_log()
+        self.valid_moves = []
+        self.selected_square = ()
+        if mode:
+            self.game_mode = mode
+            self.game_state = "PLAYING"
+        else:
+            self.game_state = "MENU"
+
+    def handle_click(self, location):
+        if self.game_state == "MENU":
+            if self.btn_pvp.is_clicked(location):
+                self.new_game("PvP")
+            elif self.btn_minimax.is_clicked(location):
+                self.new_game("PvAI")
+            elif self.btn_ai_ai.is_clicked(location):
+                self.new_game("AIvAI")
+            return
+
+        # Click side panel (luôn được, kể cả khi AI đang nghĩ: hủy tìm kiếm)
+        if location[0] > HEIGHT:
+            if self.btn_reset.is_clicked(location):
+                print("Reset Game!")
+                self.new_game()
+            elif self.btn_undo.is_clicked(location) and not self.game_over_text:
+                print("Undo Move!")
+                self.ai.cancel()
+                self.undo_move()
+                self.valid_moves = []
+                self.selected_square = ()
+            return
+
+        # Hết ván: chỉ còn nút New Game
+        if self.game_over_text:
+            return
+
+        can_click = True
+        if self.game_mode == "PvAI" and self.gs.turn == 'b':
+            can_click = False # Không click khi AI đang nghĩ
+        if self.game_mode == "AIvAI":
+            can_click = False
+        if not can_click:
+            return
+
+        col = location[0] // SQ_SIZE
+        row = location[1] // SQ_SIZE
+
+        # Click bàn cờ
+        # Nếu click lại vào chính ô đang chọn -> Hủy chọn
+        if self.selected_square == (row, col):
+            self.selected_square = ()
+            self.valid_moves = []
+            return
+
+        # Kiểm tra xem người dùng có click vào một ô đích hợp lệ không
+        clicked_move = None
+        for move in self.valid_moves:
+            if move.to_sq == (row, col):
+                clicked_move = move
+                break
+
+        if clicked_move:
+            # Trường hợp thực hiện di chuyển
+            # Nếu tìm thấy nhiều nước đi đến cùng 1 ô nghĩa là đang promotion: Q,R,B,N
+            potential_promotions = [m for m in self.valid_moves if m.to_sq == (row, col)]
+
+            final_move = clicked_move # Mặc định
+
+            if len(potential_promotions) > 1:
+                print("Cần chọn quân phong cấp")
+                color = self.gs.turn
+                choice = self.show_promotion_popup(color)
+
+                # Tìm nước đi khớp với lựa chọn của user
+                # engine.py: promo_piece = promo if color==WHITE else promo.lower()
+                target_promo = choice if color == 'w' else choice.lower()
+
+                for p_move in potential_promotions:
+                    if p_move.promotion == target_promo:
+                        final_move = p_move
+                        break
+
+            self.play_move(final_move)
+            print(f"Moved: {final_move}")
+
+            self.selected_square = ()
+            self.valid_moves = []
+
+        else:
+            # Trường hợp chọn quân mới
+            piece = self.gs.board[row][col]
+            if piece != '.':
+                self.selected_square = (row, col)
+                # các nước đi hợp lệ từ ô đã chọn (đã nhóm sẵn theo ô xuất phát)
+                self.valid_moves = self.gs.valid_moves_from((row, col))
+
+    def draw(self):
+        # Vẽ phần đã thay đổi rồi đẩy đúng những vùng đó lên màn hình
+        if self.game_state == "MENU":
+            dirty = self.draw_menu()
+        else:
+            if self.drawn_menu is not None: self.invalidate() # vừa rời menu
+            dirty = self.draw_gamestate()
+            # thông báo hết ván nằm trên cùng, vẽ lại nếu bên dưới vừa thay đổi
+            if self.game_over_text and (dirty or not self.drawn_game_over):
+                dirty.append(self.draw_game_over())
+        if dirty:
+            pygame.display.update(dirty)
+
+    # Vòng lặp chính: hướng sự kiện, ngủ khi không có gì thay đổi
     def run(self):
         running = True
         while running:
-            # Kiểm tra xem có đến lượt AI không
-            is_ai_turn = False
+            # Kiểm tra hết ván trước, để AI không bắt đầu nghĩ trên thế cờ đã kết thúc
             if self.game_state == "PLAYING":
-                if self.game_mode == "PvAI" and self.gs.turn == 'b':
-                    is_ai_turn = True
-                elif self.game_mode == "AIvAI":
-                    is_ai_turn = True
-
-            if is_ai_turn:
-                self.draw_gamestate() # Vẽ lại bàn cờ trước khi AI đi để thấy nước đi của người chơi
-                pygame.display.flip()
-                
-                pygame.time.delay(100)
-                
-                self.execute_ai_move() 
-                
-
-            for event in pygame.event.get():
+                self.check_game_over()
+
+            # Lượt AI: bắt đầu / kiểm tra kết quả tìm kiếm nền
+            if self.is_ai_turn():
+                self.execute_ai_move()
+                self.check_game_over() # nước AI vừa đi có thể kết thúc ván
+            self.draw()
+
+            # Chờ input (hoặc hết timeout khi AI đang nghĩ)
+            timeout = self.wait_timeout()
+            if timeout == 0:
+                events = pygame.event.get()
+            else:
+                first = pygame.event.wait() if timeout is None else pygame.event.wait(timeout)
+                events = [first] + pygame.event.get()
+
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
-
-                if self.game_state == "MENU":
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        if self.btn_pvp.is_clicked(pos):
-                            self.game_mode = "PvP"
-                            self.game_state = "PLAYING"
-                            self.gs = Board() # Reset board
-                        elif self.btn_minimax.is_clicked(pos):
-                            self.game_mode = "PvAI"
-                            self.game_state = "PLAYING"
-                            self.gs = Board()
-                        elif self.btn_ai_ai.is_clicked(pos):
-                            self.game_mode = "AIvAI"
-                            self.game_state = "PLAYING"
-                            self.gs = Board()
-            
-                elif self.game_state == "PLAYING":
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        can_click = True
-                        if self.game_mode == "PvAI" and self.gs.turn == 'b':
-                            can_click = False # Không click khi AI đang nghĩ
-                        if self.game_mode == "AIvAI":
-                            can_click = False 
-
-                        if can_click:
-                            location = pygame.mouse.get_pos()
-                            col = location[0] // SQ_SIZE
-                            row = location[1] // SQ_SIZE
-
-                            # Click side panel
-                            if location[0] > HEIGHT:
-                                if self.btn_reset.is_clicked(location):
-                                    print("Reset Game!")
-                                    self.gs = Board() 
-                                    self.valid_moves = []
-                                    self.selected_square = ()
-                                    self.game_state = "MENU"
-                                elif self.btn_undo.is_clicked(location):
-                                    print("Undo Move!")
-                                    self.gs.undo_move()
-                                    self.valid_moves = []
-                                    self.selected_square = ()
-                                continue
-
-                            # Click bàn cờ
-                            # Nếu click lại vào chính ô đang chọn -> Hủy chọn
-                            if self.selected_square == (row, col):
-                                self.selected_square = ()
-                                self.valid_moves = []
-                            else:
-                                # Kiểm tra xem người dùng có click vào một ô đích hợp lệ không
-                                clicked_move = None
-                                for move in self.valid_moves:
-                                    if move.to_sq == (row, col):
-                                        clicked_move = move
-                                        break
-                                
-                                if clicked_move:
-                                    # Trường hợp thực hiện di chuyển 
-                                    # Nếu tìm thấy nhiều nước đi đến cùng 1 ô nghĩa là đang promotion: Q,R,B,N
-                                    potential_promotions = [m for m in self.valid_moves if m.to_sq == (row, col)]
-                                    
-                                    final_move = clicked_move # Mặc định
-
-                                    if len(potential_promotions) > 1:
-                                        print("Cần chọn quân phong cấp")
-                                        color = self.gs.turn 
-                                        choice = self.show_promotion_popup(color) 
-                                        
-                                        # Tìm nước đi khớp với lựa chọn của user
-                                        # engine.py: promo_piece = promo if color==WHITE else promo.lower()
-                                        target_promo = choice if color == 'w' else choice.lower()
-                                        
-                                        for p_move in potential_promotions:
-                                            if p_move.promotion == target_promo:
-                                                final_move = p_move
-                                                break
-                                    
-                                    self.gs.apply_move(final_move)
-                                    print(f"Moved: {final_move}")
-                                    
-                                    self.selected_square = ()
-                                    self.valid_moves = []
-                                    
-                                else:
-                                    # Trường hợp chọn quân mới
-                                    piece = self.gs.board[row][col]
-                                    if piece != '.':
-                                        self.selected_square = (row, col)
-                                        self.valid_moves = []
-                                        
-                                        all_valid_moves = self.gs.get_valid_moves()
-                                        
-                                        # append các nước đi hợp lệ từ ô đã chọn
-                                        for move in all_valid_moves:
-                                            if move.from_sq == (row, col):
-                                                self.valid_moves.append(move)
-                        
-                        location = pygame.mouse.get_pos()
-                        if location[0] > HEIGHT:
-                            if self.btn_reset.is_clicked(location):
-                                self.game_state = "MENU" 
-
-            if self.game_state == "MENU":
-                self.draw_menu()
-            elif self.game_state == "PLAYING":
-                self.draw_gamestate()
-
-            # --- CHECK GAME OVER ---
-            game_over = False
-            winner_text = ""
-            
-            if self.gs.is_checkmate(self.gs.turn):
-                game_over = True
-                winner = "Black" if self.gs.turn == 'w' else "White"
-                winner_text = f"{winner} Wins by Checkmate!"
-            elif self.gs.is_stalemate(self.gs.turn):
-                game_over = True
-                winner_text = "Draw by Stalemate!"
-            
-            if game_over:
-                # Vẽ thông báo giữa màn hình
-                font_big = pygame.font.SysFont("Arial", 32, True, False)
-                text_surf = font_big.render(winner_text, True, pygame.Color('red'))
-                text_rect = text_surf.get_rect(center=(WIDTH//2, HEIGHT//2))
-                
-                # Viền background
-                bg_rect = text_rect.inflate(20, 20)
-                pygame.draw.rect(self.screen, pygame.Color('black'), bg_rect)
-                pygame.draw.rect(self.screen, pygame.Color('white'), bg_rect, 2)
-                
-                self.screen.blit(text_surf, text_rect)
-                pygame.display.flip()
-                
-                # Chặn game lại, chờ click để reset hoặc thoát
-                waiting_for_reset = True
-                while waiting_for_reset:
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            waiting_for_reset = False
-                            running = False
-                        if event.type == pygame.MOUSEBUTTONDOWN:
-                            location = pygame.mouse.get_pos()
-                            if self.btn_reset.is_clicked(location):
-                                print("Resetting Game after Game Over")
-                                self.gs = Board()
-                                self.valid_moves = []
-                                self.selected_square = ()
-                                self.game_state = "MENU"
-                                waiting_for_reset = False
-                    self.clock.tick(MAX_FPS)
-
-            pygame.display.flip()
-            self.clock.tick(MAX_FPS)
-
+                elif event.type == pygame.MOUSEWHEEL:
+                    if self.game_state == "PLAYING": self.scroll_move_log(event.y)
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button not in (4, 5):
+                    # nút 4/5 là con lăn (đã xử lý ở MOUSEWHEEL)
+                    self.handle_click(event.pos)
+
+        self.save_game()
+        self.ai.shutdown()
         pygame.quit()
         sys.exit()
 
@@ -0,0 +1,136 @@
+# parallel_search.py - Lazy SMP: several processes search the same position and share one hash table
+#
+#   python parallel_search.py --workers 4 --depth 5     # time-to-depth speedup versus one worker
+#
+# The calling process searches as worker 0 and decides the move; helper processes run the same
+# iterative deepening (odd helpers one ply ahead) on their own Board.from_snapshot() copy and only
+# contribute through the shared transposition table. Entries are stored lock-free as (key ^ data, data)
+# so a torn write from two processes reads back as a miss instead of a wrong entry.
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import Board
+from search import Searcher, MAX_PLY
+from tablebase import Tablebases
+
+_mp = multiprocessing.get_context('spawn')
+
+class SharedTranspositionTable:
+    # probe/store interface of search.TranspositionTable over a shared array of 2 x 64-bit words per entry
+    def __init__(self, array, entries):
+        self.array = array
+        self.entries = entries
+        self.words = memoryview(array).cast('B').cast('Q')
+
+    @classmethod
+    def create(cls, megabytes=16):
+        entries = 1 << max(10, (megabytes * 1024 * 1024 // 16).bit_length() - 1)
+        return cls(_mp.RawArray('Q', 2 * entries), entries)
+
+    def probe(self, key):
+        i = (key & (self.entries - 1)) << 1
+        words = self.words
+        data = words[i+1]
+        if words[i] ^ data != key or not data: return None
+        return (data >> 48 & 0xFF, (data >> 16 & 0xFFFFFFFF) - (1 << 31), data >> 56 & 3, data & 0xFFFF)
+
+    def store(self, key, depth, score, flag, move):
+        i = (key & (self.entries - 1)) << 1
+        data = (move & 0xFFFF) | (score + (1 << 31)) << 16 | min(depth, 255) << 48 | flag << 56 | 1 << 58
+        words = self.words
+        words[i] = key ^ data
+        words[i+1] = data
+
+# --- helper process side ---
+_tt = None
+_generation = None
+
+_tablebases = None
+
+def _init_helper(array, entries, generation, tablebase_dir):
+    global _tt, _generation, _tablebases
+    _tt = SharedTranspositionTable(array, entries)
+    _generation = generation
+    # each helper maps the tablebase files itself
+    _tablebases = Tablebases(tablebase_dir) if tablebase_dir else None
+
+def _helper_job(snapshot, generation, helper_id, max_depth):
+    board = Board.from_snapshot(snapshot)
+    searcher = Searcher(tt=_tt, tablebases=_tablebases)
+    r = searcher.search(board, max_depth=max_depth, stop=lambda: _generation.value != generation,
+                        start_depth=1 + helper_id % 2)
+    return (r.depth, r.nodes)
+
+# --- main process side ---
+class ParallelSearcher:
+    def __init__(self, workers=2, tt_megabytes=16, tablebases=None):
+        self.workers = max(1, workers)
+        self.tt = SharedTranspositionTable.create(tt_megabytes)
+        self.tablebases = tablebases
+        self._generation = _mp.Value('i', 0)
+        self._pool = None
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers - 1, mp_context=_mp, initializer=_init_helper,
+                                             initargs=(self.tt.array, self.tt.entries, self._generation,
+                                                       tablebases.directory if tablebases else None))
+
+    def search(self, board, max_depth=MAX_PLY, max_nodes=None, time_limit=None, stop=None):
+        # Same budgets and result as Searcher.search; nodes include the helpers' nodes
+        generation = self._generation.value
+        helpers = []
+        if self._pool is not None:
+            snapshot = board.snapshot()
+            helpers = [self._pool.submit(_helper_job, snapshot, generation, i, max_depth)
+                       for i in range(1, self.workers)]
+        try:
+            result = Searcher(tt=self.tt, tablebases=self.tablebases).search(board, max_depth, max_nodes, time_limit, stop)
+        finally:
+            with self._generation.get_lock():
+                self._generation.value += 1   # stops the helpers
+        for f in helpers:
+            depth, nodes = f.result()
+            result.nodes += nodes
+        return result
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def time_to_depth(board, depth, workers):
+    with ParallelSearcher(workers) as searcher:
+        if workers > 1: searcher.search(board, max_depth=1)   # start the helper processes before timing
+        start = time.perf_counter()
+        result = searcher.search(board, max_depth=depth)
+        return time.perf_counter() - start, result
+
+def main(argv=None):
+    from perft import POSITIONS
+    parser = argparse.ArgumentParser(description="Lazy SMP time-to-depth benchmark")
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('-p', '--position', action='append', choices=sorted(POSITIONS),
+                        help="position(s) to search (default: all perft positions)")
+    args = parser.parse_args(argv)
+
+    total = {1: 0.0, args.workers: 0.0}
+    for name in args.position or sorted(POSITIONS):
+        fen = POSITIONS[name][0]
+        line = f"{name:<9}"
+        for workers in total:
+            elapsed, result = time_to_depth(Board(fen), args.depth, workers)
+            total[workers] += elapsed
+            line += f"  {workers:>2} worker(s): {elapsed:6.2f}s {result.move.uci() if result.move else '-':<6} {result.nodes:>8} nodes"
+        print(line)
+    one, many = total[1], total[args.workers]
+    print(f"time to depth {args.depth}: 1 worker {one:.2f}s, {args.workers} workers {many:.2f}s, speedup {one / many if many else 0:.2f}x")
+
+if __name__ == "__main__":
+    main()
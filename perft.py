@@ -0,0 +1,97 @@
+# perft.py - move generator node counts and throughput benchmark (legal_codes/make_code/unmake_code)
+#
+#   python perft.py                      # start position, depth 3
+#   python perft.py -d 4 --divide        # per-root-move counts
+#   python perft.py -p kiwipete -d 3 --cache
+#   python perft.py --suite              # check every position against its known counts
+import argparse
+import time
+from engine import Board
+
+# name: (FEN, expected counts for depth 1..n)
+# The engine has no en passant, so only depths where published counts contain no e.p. captures are listed.
+POSITIONS = {
+    'startpos': ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281]),
+    'kiwipete': ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48]),
+    'pos3': ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191]),
+    'pos4': ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264]),
+    'pos5': ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    'pos6': ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+}
+
+def perft(board, depth, cache=None):
+    if depth == 0: return 1
+    if cache is not None:
+        key = (board.hash, depth)
+        if key in cache: return cache[key]
+    moves = board.legal_codes()
+    if depth == 1:
+        nodes = len(moves)
+    else:
+        nodes = 0
+        for code in moves:
+            board.make_code(code)
+            nodes += perft(board, depth-1, cache)
+            board.unmake_code()
+    if cache is not None: cache[key] = nodes
+    return nodes
+
+def divide(board, depth, cache=None):
+    # [(move, leaf count below it)] for every legal root move
+    result = []
+    for m in board.get_valid_moves():
+        board.apply_move(m)
+        result.append((m, perft(board, depth-1, cache)))
+        board.undo_move()
+    return result
+
+def run(board, depth, show_divide=False, use_cache=False):
+    cache = {} if use_cache else None
+    start = time.perf_counter()
+    if show_divide:
+        rows = divide(board, depth, cache)
+        for m,n in sorted(rows, key=lambda x: x[0].uci()):
+            print(f"{m.uci()}: {n}")
+        nodes = sum(n for _,n in rows)
+    else:
+        nodes = perft(board, depth, cache)
+    elapsed = time.perf_counter() - start
+    nps = nodes / elapsed if elapsed > 0 else 0.0
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.3f}s ({nps:,.0f} nodes/s)")
+    return nodes, elapsed
+
+def run_suite(max_depth=None, use_cache=False):
+    ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name,(fen,expected) in POSITIONS.items():
+        for depth,want in enumerate(expected, 1):
+            if max_depth and depth > max_depth: break
+            print(f"{name:<9}", end=" ")
+            nodes, elapsed = run(Board(fen), depth, use_cache=use_cache)
+            total_nodes += nodes; total_time += elapsed
+            if nodes != want:
+                ok = False
+                print(f"  MISMATCH: expected {want}")
+    print(f"{'PASS' if ok else 'FAIL'}: {total_nodes} nodes in {total_time:.2f}s "
+          f"({total_nodes / total_time if total_time else 0:,.0f} nodes/s)")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts for engine.Board")
+    parser.add_argument('-d', '--depth', type=int, help="search depth (default 3; --suite: all known depths)")
+    parser.add_argument('-p', '--position', choices=sorted(POSITIONS), default='startpos')
+    parser.add_argument('--fen', help="position to count from (overrides --position)")
+    parser.add_argument('--divide', action='store_true', help="print counts per root move")
+    parser.add_argument('--cache', action='store_true', help="reuse counts of transposed positions (hash-keyed)")
+    parser.add_argument('--suite', action='store_true', help="run every known position, up to --depth if given")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 0 if run_suite(args.depth, args.cache) else 1
+    board = Board(args.fen or POSITIONS[args.position][0])
+    run(board, args.depth or 3, args.divide, args.cache)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
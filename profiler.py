@@ -0,0 +1,190 @@
+# profiler.py - opt-in call counters and timings for the engine's hot paths
+#
+#   import profiler
+#   profiler.enable()            # or: with profiler.profiling(): ...
+#   ...search / perft / play...
+#   profiler.dump('profile.json')
+#   profiler.disable()
+#
+#   python profiler.py -d 5 --json profile.json     # profile searches on a few test positions
+#
+# enable() swaps timed wrappers onto engine.Board, search.Searcher and the evaluate functions and
+# disable() puts the original functions back, so with profiling off the engine runs its usual code and
+# pays nothing. Times are inclusive (legal_codes includes its _legal_moves call) and wall clock.
+# Only the current process is counted: searches in ai_worker / parallel_search helpers are not.
+import argparse
+import inspect
+import json
+import time
+from functools import wraps
+import engine
+import evaluation
+import search
+
+# (owner, attribute) pairs that get wrapped; owners are classes or modules
+BOARD_METHODS = ['generate_pseudo_legal_moves', 'pseudo_legal_codes', 'get_valid_moves', 'legal_codes', '_legal_moves',
+                 'capture_codes', 'quiet_codes', 'is_legal_code', 'is_square_attacked', '_attacked', '_attackers',
+                 'find_king', 'is_in_check', 'make_code', 'unmake_code', 'decode_move']
+TARGETS = ([(engine.Board, name) for name in BOARD_METHODS]
+           + [(search.Searcher, name) for name in ('_captures', '_picker', '_probe_tablebases')]
+           # search.py imported evaluate by name, so its reference is wrapped as well
+           + [(evaluation, 'evaluate'), (search, 'evaluate')])
+SEARCH_COUNTERS = ('nodes', 'qnodes', 'cutoffs', 'tt_probes', 'tt_hits')
+
+_originals = {}     # (owner, attribute) -> original function while enabled
+_calls = {}         # name -> [calls, seconds]
+_search = {}        # summed Searcher counters
+_started = None
+
+def _label(owner, name):
+    return f"{owner.__name__}.{name}"
+
+def _timed(func, counter):
+    perf_counter = time.perf_counter
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        t = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            counter[1] += perf_counter() - t
+            counter[0] += 1
+    return wrapper
+
+def _timed_generator(func, counter):
+    # generators are timed while they run, not while the caller works between items
+    perf_counter = time.perf_counter
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        counter[0] += 1
+        it = func(*args, **kwargs)
+        while True:
+            t = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                counter[1] += perf_counter() - t
+                return
+            counter[1] += perf_counter() - t
+            yield item
+    return wrapper
+
+def _timed_search(func, counter):
+    # Searcher.search: time it and add the searcher's counters once it returns
+    perf_counter = time.perf_counter
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        t = perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            counter[1] += perf_counter() - t
+            counter[0] += 1
+            for name in SEARCH_COUNTERS:
+                _search[name] = _search.get(name, 0) + getattr(self, name, 0)
+            # node counts of consecutive finished iterations, for the effective branching factor
+            totals = getattr(self, 'iteration_nodes', [])
+            per_depth = [b - a for a, b in zip([0] + totals, totals)]
+            for a, b in zip(per_depth, per_depth[1:]):
+                if a > 0:
+                    _search['branching_sum'] = _search.get('branching_sum', 0.0) + b / a
+                    _search['branching_count'] = _search.get('branching_count', 0) + 1
+    return wrapper
+
+def enabled():
+    return bool(_originals)
+
+def enable():
+    # install the wrappers (counters keep their values; see reset)
+    global _started
+    if _originals: return
+    if _started is None: _started = time.perf_counter()
+    for owner, name in TARGETS + [(search.Searcher, 'search')]:
+        func = owner.__dict__[name]
+        counter = _calls.setdefault(_label(owner, name), [0, 0.0])
+        if owner is search.Searcher and name == 'search': wrapper = _timed_search(func, counter)
+        elif inspect.isgeneratorfunction(func): wrapper = _timed_generator(func, counter)
+        else: wrapper = _timed(func, counter)
+        _originals[(owner, name)] = func
+        setattr(owner, name, wrapper)
+
+def disable():
+    # put the original functions back
+    for (owner, name), func in _originals.items():
+        setattr(owner, name, func)
+    _originals.clear()
+
+def reset():
+    global _started
+    for counter in _calls.values():
+        counter[0] = 0; counter[1] = 0.0
+    _search.clear()
+    _started = time.perf_counter() if _originals else None
+
+class profiling:
+    # with profiling(): ... -> counters of the block only
+    def __init__(self, reset_counters=True):
+        self.reset_counters = reset_counters
+
+    def __enter__(self):
+        if self.reset_counters: reset()
+        enable()
+        return self
+
+    def __exit__(self, *exc):
+        disable()
+        return False
+
+def snapshot():
+    # Plain dict of the counters so far (JSON serialisable)
+    elapsed = time.perf_counter() - _started if _started is not None else 0.0
+    calls = {name: {'calls': n, 'seconds': round(t, 6), 'us_per_call': round(1e6 * t / n, 3) if n else 0.0}
+             for name, (n, t) in sorted(_calls.items()) if n}
+    s = {name: _search.get(name, 0) for name in SEARCH_COUNTERS}
+    searches = _calls.get(_label(search.Searcher, 'search'), [0, 0.0])
+    s['searches'] = searches[0]
+    s['seconds'] = round(searches[1], 6)
+    s['nps'] = round(s['nodes'] / searches[1]) if searches[1] > 0 else 0
+    s['qnode_share'] = round(s['qnodes'] / s['nodes'], 4) if s['nodes'] else 0.0
+    s['tt_hit_rate'] = round(s['tt_hits'] / s['tt_probes'], 4) if s['tt_probes'] else 0.0
+    count = _search.get('branching_count', 0)
+    s['branching_factor'] = round(_search['branching_sum'] / count, 3) if count else 0.0
+    return {'enabled': enabled(), 'elapsed': round(elapsed, 6), 'calls': calls, 'search': s}
+
+def dump(path=None):
+    # snapshot() as JSON text, also written to path if given
+    text = json.dumps(snapshot(), indent=2)
+    if path:
+        with open(path, 'w') as f: f.write(text + '\n')
+    return text
+
+def report(snap=None):
+    # human readable table of a snapshot
+    snap = snap or snapshot()
+    lines = [f"{'function':<36} {'calls':>10} {'seconds':>9} {'us/call':>9}"]
+    for name, c in sorted(snap['calls'].items(), key=lambda kv: -kv[1]['seconds']):
+        lines.append(f"{name:<36} {c['calls']:>10} {c['seconds']:>9.3f} {c['us_per_call']:>9.2f}")
+    s = snap['search']
+    if s['searches']:
+        lines.append(f"{s['searches']} searches: {s['nodes']} nodes ({100 * s['qnode_share']:.1f}% quiescence), "
+                     f"{s['nps']:,} nodes/s, {s['cutoffs']} cutoffs, tt hit rate {100 * s['tt_hit_rate']:.1f}%, "
+                     f"branching factor {s['branching_factor']:.2f}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    from perft import POSITIONS
+    parser = argparse.ArgumentParser(description="Profile fixed-depth searches on the perft test positions")
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('--fen', action='append', help="position to search (repeatable; default: the perft positions)")
+    parser.add_argument('--json', help="write the snapshot to this file")
+    args = parser.parse_args(argv)
+
+    fens = args.fen or [fen for fen, _ in POSITIONS.values()]
+    with profiling():
+        for fen in fens:
+            search.Searcher().search(engine.Board(fen), max_depth=args.depth)
+        if args.json: dump(args.json)
+        print(report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# search.py - negamax alpha-beta with iterative deepening over engine.Board
+import time
+from evaluation import evaluate, PIECE_VALUES
+
+MATE = 100000
+INF = 10**9
+MAX_PLY = 64
+
+# transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# promotion index of a packed move -> piece value
+PROMO_VALUES = [0, PIECE_VALUES['n'], PIECE_VALUES['b'], PIECE_VALUES['r'], PIECE_VALUES['q']]
+
+class SearchStopped(Exception):
+    pass
+
+class SearchResult:
+    def __init__(self, move=None, score=0, depth=0, nodes=0, pv=None, elapsed=0.0):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.pv = pv or []
+        self.elapsed = elapsed
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        pv = ' '.join(m.uci() for m in self.pv)
+        return f"SearchResult(move={self.move}, score={self.score}, depth={self.depth}, nodes={self.nodes}, pv=[{pv}])"
+
+def is_mate_score(score):
+    # tablebase mates can lie up to ~60 plies past the search horizon
+    return abs(score) >= MATE - 2 * MAX_PLY
+
+# Mate scores count plies from the root; in the transposition table they count from the stored node,
+# so a mate found at one ply reads back with the right distance at another
+def score_to_tt(score, ply):
+    if not is_mate_score(score): return score
+    return score + ply if score > 0 else score - ply
+
+def score_from_tt(score, ply):
+    if not is_mate_score(score): return score
+    return score - ply if score > 0 else score + ply
+
+class TranspositionTable:
+    # hash -> (depth, score, flag, packed move); cleared when full
+    def __init__(self, size=1 << 18):
+        self.size = size
+        self.table = {}
+
+    def probe(self, key):
+        return self.table.get(key)
+
+    def store(self, key, depth, score, flag, move):
+        if len(self.table) >= self.size: self.table.clear()
+        self.table[key] = (depth, score, flag, move)
+
+class Searcher:
+    # Works on packed moves (engine.Board.legal_codes/make_code/unmake_code); only the result is decoded to Move objects.
+    # tt can be any object with probe/store (e.g. the shared table of parallel_search).
+    # tablebases (tablebase.Tablebases) gives exact scores once 3 or fewer pieces are left.
+    def __init__(self, tt=None, tt_size=1 << 18, tablebases=None):
+        self.tt = tt if tt is not None else TranspositionTable(tt_size)
+        self.tablebases = tablebases
+        self.nodes = 0
+        self._reset_stats()
+
+    def _reset_stats(self):
+        # per-search counters (profiler.py adds them up across searches)
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.iteration_nodes = []
+
+    def search(self, board, max_depth=MAX_PLY, max_nodes=None, time_limit=None, stop=None, on_iteration=None, start_depth=1):
+        # Iterative deepening until max_depth, the node/time budget runs out or stop() returns True.
+        # Returns the result of the deepest finished iteration (or the improved root move of an unfinished one).
+        self.nodes = 0
+        self._reset_stats()
+        self.max_nodes = max_nodes
+        self.deadline = time.perf_counter() + time_limit if time_limit else None
+        self.stop = stop
+        self.killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self.history = {}
+        # positions already on the board's path, for repetition detection
+        self.path = board.history_hashes()
+        self.path.append(board.hash)
+        start = time.perf_counter()
+
+        root_moves = board.legal_codes()
+        result = SearchResult(board.decode_move(root_moves[0]) if root_moves else None)
+        if len(root_moves) <= 1:
+            result.elapsed = time.perf_counter() - start
+            return result
+        # a tablebase position needs no search
+        tb = self._probe_tablebases(board, 0)
+        if tb is not None:
+            move = self.tablebases.best_move(board)
+            if move is not None:
+                return SearchResult(move, tb, 0, 0, [move], time.perf_counter() - start)
+
+        for depth in range(start_depth, max_depth + 1):
+            self.root_best = None
+            try:
+                score = self._root(board, root_moves, depth)
+            except SearchStopped:
+                # the previous best move is searched first, so a root_best here beat it at the deeper depth
+                if self.root_best is not None and self.root_best[0] != result.move.code:
+                    result.move = board.decode_move(self.root_best[0])
+                    result.score = self.root_best[1]
+                    result.pv = [result.move]
+                break
+            self.iteration_nodes.append(self.nodes)
+            pv = self._pv(board, depth)
+            result = SearchResult(pv[0] if pv else board.decode_move(self.root_best[0]), score, depth, self.nodes, pv)
+            result.elapsed = time.perf_counter() - start
+            if on_iteration: on_iteration(result)
+            if is_mate_score(score) and MATE - abs(score) <= depth: break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _probe_tablebases(self, board, ply):
+        # exact score from the tablebases, or None
+        if self.tablebases is None or len(board.piece_lists['w']) + len(board.piece_lists['b']) > 3: return None
+        r = self.tablebases.probe(board)
+        if r is None: return None
+        result, plies = r
+        if result == 'draw': return 0
+        return MATE - ply - plies if result == 'win' else -(MATE - ply - plies)
+
+    def _check_limits(self):
+        if self.max_nodes is not None and self.nodes >= self.max_nodes: raise SearchStopped()
+        if self.deadline is not None and time.perf_counter() >= self.deadline: raise SearchStopped()
+        if self.stop is not None and self.stop(): raise SearchStopped()
+
+    def _root(self, board, moves, depth):
+        alpha, beta = -INF, INF
+        tt_move = self._tt_move(board)
+        moves.sort(key=lambda m: self._order(board, m, tt_move, 0), reverse=True)
+        best = None
+        for m in moves:
+            board.make_code(m)
+            self.path.append(board.hash)
+            try:
+                score = -self._negamax(board, depth-1, -beta, -alpha, 1)
+            finally:
+                self.path.pop()
+                board.unmake_code()
+            if score > alpha:
+                alpha = score
+                best = m
+                self.root_best = (m, score)
+        self._store(board.hash, depth, alpha, EXACT, best, 0)
+        # keep the best move first for the next iteration
+        moves.remove(best); moves.insert(0, best)
+        return alpha
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0: self._check_limits()
+
+        # draws by the fifty-move rule or repetition on the current path; a repeated position can only
+        # lie after the last capture or pawn move, so only the last halfmove_clock plies are scanned
+        if board.halfmove_clock >= 100 or self.path[-board.halfmove_clock-1:].count(board.hash) > 1: return 0
+        tb = self._probe_tablebases(board, ply)
+        if tb is not None: return tb
+
+        in_check = board.is_in_check(board.turn)
+        if in_check and ply < MAX_PLY: depth += 1
+        if ply >= MAX_PLY: return evaluate(board)
+        if depth <= 0: return self._quiesce(board, alpha, beta, ply)
+
+        key = board.hash
+        alpha_orig = alpha
+        entry = self.tt.probe(key)
+        self.tt_probes += 1
+        tt_move = 0
+        if entry is not None:
+            self.tt_hits += 1
+            e_depth, e_score, e_flag, tt_move = entry
+            e_score = score_from_tt(e_score, ply)
+            if e_depth >= depth:
+                if e_flag == EXACT: return e_score
+                if e_flag == LOWER and e_score >= beta: return e_score
+                if e_flag == UPPER and e_score <= alpha: return e_score
+
+        best_score = -INF
+        best_move = 0
+        for m in self._picker(board, tt_move, ply):
+            board.make_code(m)
+            self.path.append(board.hash)
+            try:
+                score = -self._negamax(board, depth-1, -beta, -alpha, ply+1)
+            finally:
+                self.path.pop()
+                board.unmake_code()
+            if score > best_score:
+                best_score = score
+                best_move = m
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if board.piece_at(m >> 6 & 63) == '.' and not m >> 12 & 7:
+                            killers = self.killers[ply]
+                            if killers[0] != m:
+                                killers[1] = killers[0]; killers[0] = m
+                            self.history[m] = self.history.get(m, 0) + depth * depth
+                        break
+        if best_move == 0:
+            return -MATE + ply if in_check else 0
+
+        flag = EXACT
+        if best_score <= alpha_orig: flag = UPPER
+        elif best_score >= beta: flag = LOWER
+        self._store(key, depth, best_score, flag, best_move, ply)
+        return best_score
+
+    def _quiesce(self, board, alpha, beta, ply):
+        # captures and promotions only, until the position is quiet; the side to move may stand pat on the static score
+        self.nodes += 1
+        self.qnodes += 1
+        if self.nodes & 1023 == 0: self._check_limits()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY: return stand_pat
+        if stand_pat > alpha: alpha = stand_pat
+        for m in self._captures(board):
+            board.make_code(m)
+            try:
+                score = -self._quiesce(board, -beta, -alpha, ply+1)
+            finally:
+                board.unmake_code()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta: break
+        return alpha
+
+    def _captures(self, board):
+        # legal captures and promotions, most valuable victim first, then least valuable attacker
+        moves = board.capture_codes()
+        piece_at = board.piece_at
+        moves.sort(key=lambda m: 10 * PIECE_VALUES.get(piece_at(m >> 6 & 63).lower(), 0) - PIECE_VALUES[piece_at(m & 63).lower()]
+                   + PROMO_VALUES[m >> 12 & 7], reverse=True)
+        return moves
+
+    def _picker(self, board, tt_move, ply):
+        # Staged, lazy move ordering: hash move, captures and promotions (MVV-LVA), killers, then quiets by history.
+        # Later stages are only generated if the search hasn't cut off by then.
+        if tt_move and board.is_legal_code(tt_move): yield tt_move
+        else: tt_move = 0
+        for m in self._captures(board):
+            if m != tt_move: yield m
+        killers = [k for k in self.killers[ply] if k and k != tt_move and board.piece_at(k >> 6 & 63) == '.'
+                   and board.is_legal_code(k)]
+        yield from killers
+        quiets = [m for m in board.quiet_codes() if m != tt_move and m not in killers]
+        history = self.history
+        quiets.sort(key=lambda m: history.get(m, 0), reverse=True)
+        yield from quiets
+
+    def _order(self, board, m, tt_move, ply):
+        if m == tt_move: return 10**7
+        victim = board.piece_at(m >> 6 & 63)
+        if victim != '.':
+            # MVV-LVA
+            return 10**6 + 10 * PIECE_VALUES[victim.lower()] - PIECE_VALUES[board.piece_at(m & 63).lower()]
+        if m >> 12 & 7: return 10**6 + PROMO_VALUES[m >> 12 & 7]
+        if m == self.killers[ply][0] or m == self.killers[ply][1]: return 10**5
+        return self.history.get(m, 0)
+
+    def _tt_move(self, board):
+        entry = self.tt.probe(board.hash)
+        return entry[3] if entry else 0
+
+    def _store(self, key, depth, score, flag, move, ply):
+        self.tt.store(key, depth, score_to_tt(score, ply), flag, move)
+
+    def _pv(self, board, depth):
+        # follow hash moves from the root to rebuild the principal variation
+        pv = []
+        seen = set()
+        for _ in range(depth):
+            code = self._tt_move(board)
+            if not code or board.hash in seen or code not in board.legal_codes(): break
+            seen.add(board.hash)
+            pv.append(board.decode_move(code))
+            board.make_code(code)
+        for _ in pv: board.unmake_code()
+        return pv
+
+def find_best_move(board, max_depth=MAX_PLY, max_nodes=None, time_limit=None, stop=None, tablebases=None):
+    return Searcher(tablebases=tablebases).search(board, max_depth, max_nodes, time_limit, stop)
@@ -0,0 +1,136 @@
+# selfplay.py - headless engine-vs-engine matches over a process pool (no pygame)
+#
+#   python selfplay.py -n 100 -a depth=3 -b nodes=2000 -o games.jsonl
+#
+# Each finished game is appended to the output file as one JSON line:
+#   {"game": 7, "white": "A", "black": "B", "result": "1-0", "reason": "checkmate", "plies": 83, "moves": ["e2e4", ...]}
+# Engine specs are comma separated search budgets: depth=N, nodes=N, time=SECONDS.
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from engine import Board, WHITE, code_uci
+from search import Searcher
+
+def parse_engine(spec):
+    budget = {}
+    names = {'depth': ('max_depth', int), 'nodes': ('max_nodes', int), 'time': ('time_limit', float)}
+    for part in filter(None, spec.split(',')):
+        key, _, value = part.partition('=')
+        if key not in names: raise ValueError(f"unknown engine option {key!r} in {spec!r}")
+        name, kind = names[key]
+        budget[name] = kind(value)
+    if not budget: raise ValueError(f"engine spec {spec!r} sets no budget")
+    return budget
+
+def insufficient_material(board):
+    # bare kings, or a single minor piece left on the board
+    bb = board.bitboards
+    if bb['P'] | bb['p'] | bb['R'] | bb['r'] | bb['Q'] | bb['q']: return False
+    return bin(bb['N'] | bb['n'] | bb['B'] | bb['b']).count('1') <= 1
+
+def play_game(game_id, white, black, max_plies=300, random_plies=0, seed=0):
+    # Play one game; white/black are search budgets. Returns (result, reason, move list in uci)
+    board = Board()
+    searchers = {WHITE: Searcher(), 'b': Searcher()}
+    budgets = {WHITE: white, 'b': black}
+    rng = random.Random(seed * 1000003 + game_id)
+    moves = []
+    result, reason = '1/2-1/2', 'ply limit'
+    while len(moves) < max_plies:
+        status = board.game_status()
+        if status == 'checkmate':
+            result, reason = ('0-1' if board.turn == WHITE else '1-0'), 'checkmate'
+            break
+        if status == 'stalemate':
+            reason = 'stalemate'; break
+        if board.halfmove_clock >= 100:
+            reason = 'fifty-move rule'; break
+        if board.history_hashes().count(board.hash) >= 2:
+            reason = 'threefold repetition'; break
+        if insufficient_material(board):
+            reason = 'insufficient material'; break
+        if len(moves) < random_plies:
+            move = rng.choice(board.get_valid_moves())
+        else:
+            move = searchers[board.turn].search(board, **budgets[board.turn]).move
+        board.apply_move(move)
+        moves.append(code_uci(move.code))
+    return result, reason, moves
+
+def _play_job(game_id, engine_a, engine_b, max_plies, random_plies, seed):
+    # engine A plays white in even games
+    a_white = game_id % 2 == 0
+    white, black = (engine_a, engine_b) if a_white else (engine_b, engine_a)
+    start = time.perf_counter()
+    result, reason, moves = play_game(game_id, white, black, max_plies, random_plies, seed)
+    return {'game': game_id, 'white': 'A' if a_white else 'B', 'black': 'B' if a_white else 'A',
+            'result': result, 'reason': reason, 'plies': len(moves), 'seconds': round(time.perf_counter() - start, 3),
+            'random_plies': min(random_plies, len(moves)), 'moves': moves}
+
+def score_for_a(record):
+    if record['result'] == '1/2-1/2': return 0.5
+    white_won = record['result'] == '1-0'
+    return 1.0 if white_won == (record['white'] == 'A') else 0.0
+
+def summarize(scores):
+    # (wins, draws, losses, mean score, 95% half-width, elo, elo low, elo high) for engine A
+    n = len(scores)
+    wins = scores.count(1.0); draws = scores.count(0.5); losses = scores.count(0.0)
+    mean = sum(scores) / n
+    var = sum((s - mean) ** 2 for s in scores) / (n - 1) if n > 1 else 0.0
+    margin = 1.96 * math.sqrt(var / n)
+    def elo(p):
+        p = min(max(p, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / p - 1)
+    return wins, draws, losses, mean, margin, elo(mean), elo(mean - margin), elo(mean + margin)
+
+def run_match(games, engine_a, engine_b, out_path, workers=None, max_plies=300, random_plies=4, seed=0):
+    scores = []
+    plies = errors = 0
+    start = time.perf_counter()
+    with open(out_path, 'a') as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_play_job, i, engine_a, engine_b, max_plies, random_plies, seed) for i in range(games)]
+        for job in as_completed(jobs):
+            try:
+                record = job.result()
+            except Exception as e:
+                # one broken game is reported and left out of the score
+                errors += 1
+                print(f"game failed: {e!r}")
+                continue
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            scores.append(score_for_a(record))
+            plies += record['plies']
+            print(f"game {record['game']:>4}: {record['white']} vs {record['black']} {record['result']:<7} "
+                  f"({record['reason']}, {record['plies']} plies)  [{len(scores)}/{games}]")
+    elapsed = time.perf_counter() - start
+    if errors: print(f"{errors} of {games} games failed")
+    if not scores: return scores
+    wins, draws, losses, mean, margin, elo, elo_lo, elo_hi = summarize(scores)
+    print(f"{len(scores)} games in {elapsed:.1f}s: {len(scores) / elapsed:.2f} games/s, {plies / elapsed:.1f} plies/s")
+    print(f"A vs B: +{wins} ={draws} -{losses}  score {mean:.3f} ± {margin:.3f}  "
+          f"Elo {elo:+.0f} [{elo_lo:+.0f}, {elo_hi:+.0f}] (95%)")
+    return scores
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless self-play between two search configurations")
+    parser.add_argument('-n', '--games', type=int, default=20)
+    parser.add_argument('-a', '--engine-a', default='depth=3', help="budget of engine A, e.g. depth=3 or nodes=2000,time=0.5")
+    parser.add_argument('-b', '--engine-b', default='depth=2')
+    parser.add_argument('-o', '--output', default='selfplay_games.jsonl', help="JSON lines file, appended to")
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--max-plies', type=int, default=300, help="adjudicate a draw after this many plies")
+    parser.add_argument('--random-plies', type=int, default=4, help="random opening plies so games differ")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.games < 1: parser.error("--games must be at least 1")
+    run_match(args.games, parse_engine(args.engine_a), parse_engine(args.engine_b), args.output,
+              args.workers, args.max_plies, args.random_plies, args.seed)
+
+if __name__ == "__main__":
+    main()
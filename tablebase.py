@@ -0,0 +1,245 @@
+# tablebase.py - locally generated 3-man endgame tablebases (KQK, KRK, KPK) with mmap probing
+#
+#   python tablebase.py generate            # writes tablebases/KQK.tb, KRK.tb, KPK.tb
+#   python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+#
+# Positions are seen from the side with the extra piece ("white"); a position where Black has it is
+# probed colour-flipped. Index = ((stm*64 + white king)*64 + black king)*64 + piece square, one byte per
+# index: 0 draw, 255 illegal / not stored, otherwise plies-to-mate + 1 (odd plies: side to move mates,
+# even plies: side to move gets mated). Only one position per symmetry class is stored (white king in
+# a1-d1-d4 without pawns, pawn on files a-d with one), so probing canonicalises first.
+#
+# Generation is retrograde: every stored position is expanded once with engine.Board move generation to
+# count its moves and record it as a predecessor of its successors, then results spread backwards from
+# the mates ply by ply.
+import argparse
+import mmap
+import os
+from engine import Board, PIECES, WHITE, BLACK
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+MAGIC = b'CHSTB001'
+SIZE = 2 * 64 * 64 * 64
+DRAW, INVALID = 0, 255
+# generation order: KPK promotes into the other two
+MATERIAL = {'KQK': 'Q', 'KRK': 'R', 'KPK': 'P'}
+
+# --- symmetry ---
+def _flip_file(sq): return sq ^ 7
+def _flip_rank(sq): return sq ^ 56
+def _transpose(sq): return (7 - (sq & 7)) * 8 + (7 - (sq >> 3))
+
+def canonical(wk, bk, x, pawn):
+    # map (white king, black king, piece) to the stored representative of its symmetry class
+    if pawn:
+        if (x & 7) > 3: return _flip_file(wk), _flip_file(bk), _flip_file(x)
+        return wk, bk, x
+    if (wk & 7) > 3: wk, bk, x = _flip_file(wk), _flip_file(bk), _flip_file(x)
+    if (wk >> 3) < 4: wk, bk, x = _flip_rank(wk), _flip_rank(bk), _flip_rank(x)
+    # now file a-d, rank 1-4; keep rank <= file (a1-d1-d4 triangle)
+    if 7 - (wk >> 3) > (wk & 7): wk, bk, x = _transpose(wk), _transpose(bk), _transpose(x)
+    return wk, bk, x
+
+def index(stm_white, wk, bk, x):
+    return (((0 if stm_white else 1) * 64 + wk) * 64 + bk) * 64 + x
+
+def encode(win, plies):
+    return plies + 1 if win or plies else 1
+
+def decode(value):
+    # (result for the side to move, plies to mate); result is 'win', 'loss' or 'draw'
+    if value == DRAW: return 'draw', 0
+    plies = value - 1
+    return ('win' if plies % 2 else 'loss'), plies
+
+# --- generation ---
+def _board(wk, bk, x, piece, stm_white):
+    bitboards = dict.fromkeys(PIECES, 0)
+    bitboards['K'] = 1 << wk; bitboards['k'] = 1 << bk; bitboards[piece] |= 1 << x
+    return Board.from_snapshot((tuple(bitboards[p] for p in PIECES), WHITE if stm_white else BLACK, 0, 0, 1, 0, ()))
+
+def _positions(pawn):
+    for stm_white in (True, False):
+        for wk in range(64):
+            for bk in range(64):
+                if bk == wk: continue
+                for x in range(64):
+                    if x == wk or x == bk: continue
+                    if pawn and (x < 8 or x >= 56): continue
+                    if canonical(wk, bk, x, pawn) != (wk, bk, x): continue
+                    yield stm_white, wk, bk, x
+
+def generate(name, directory=TABLEBASE_DIR, progress=print):
+    piece = MATERIAL[name]
+    pawn = piece == 'P'
+    others = Tablebases(directory)   # for promotions
+    table = bytearray([INVALID]) * SIZE
+    count = {}          # unresolved position -> moves left that don't lose for it
+    preds = {}          # position -> positions with a move into it
+    has_draw = set()    # positions with a move into a drawn position outside this table
+    buckets = {}        # plies -> [(position, encoded value)]
+
+    def schedule(pos, value):
+        buckets.setdefault(value - 1, []).append((pos, value))
+
+    for n, (stm_white, wk, bk, x) in enumerate(_positions(pawn)):
+        if progress and n and n % 50000 == 0: progress(f"{name}: expanded {n} positions")
+        board = _board(wk, bk, x, piece, stm_white)
+        # the side not to move must not be in check
+        if board.is_in_check(BLACK if stm_white else WHITE): continue
+        pos = index(stm_white, wk, bk, x)
+        moves = board.legal_codes()
+        if not moves:
+            table[pos] = encode(False, 0) if board.is_in_check(board.turn) else DRAW
+            if table[pos] != DRAW: schedule(pos, table[pos])
+            continue
+        table[pos] = DRAW   # until resolved
+        inside = 0
+        ext_win = None; ext_loss = -1
+        for code in moves:
+            board.make_code(code)
+            lists = board.piece_lists
+            strong = [p for p in lists[WHITE].values() if p != 'K']
+            if not strong:
+                has_draw.add(pos)   # piece captured: bare kings
+            elif strong[0] == piece:
+                sx = next(sq for sq, p in lists[WHITE].items() if p != 'K')
+                succ = index(not stm_white, *canonical(board.king_sq[WHITE], board.king_sq[BLACK], sx, pawn))
+                preds.setdefault(succ, []).append(pos)
+                inside += 1
+            else:
+                # promotion: look the result up in that piece's table
+                r = others.probe(board)
+                if r is None or r[0] == 'draw': has_draw.add(pos)
+                elif r[0] == 'loss': ext_win = r[1] + 1 if ext_win is None else min(ext_win, r[1] + 1)
+                else: ext_loss = max(ext_loss, r[1])
+            board.unmake_code()
+        count[pos] = inside
+        if ext_win is not None: schedule(pos, encode(True, ext_win))
+        elif inside == 0 and pos not in has_draw: schedule(pos, encode(False, ext_loss + 1))
+        elif ext_loss >= 0: count[pos] = (inside, ext_loss)
+
+    resolved = set()
+    plies = 0
+    while buckets:
+        for pos, value in buckets.pop(plies, []):
+            if pos in resolved: continue
+            resolved.add(pos)
+            table[pos] = value
+            win = decode(value)[0] == 'win'
+            for p in preds.get(pos, ()):
+                if p in resolved: continue
+                if not win:
+                    schedule(p, encode(True, plies + 1))
+                    continue
+                left = count[p]
+                ext_loss = -1
+                if isinstance(left, tuple): left, ext_loss = left
+                left -= 1
+                count[p] = (left, ext_loss) if ext_loss >= 0 else left
+                if left == 0 and p not in has_draw:
+                    schedule(p, encode(False, max(plies, ext_loss) + 1))
+        plies += 1
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.tb')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(table)
+    if progress: progress(f"{name}: {len(resolved)} decided positions, longest mate {plies - 1} plies -> {path}")
+    return path
+
+# --- probing ---
+class Tablebases:
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self._tables = {}
+
+    def _table(self, name):
+        if name not in self._tables:
+            path = os.path.join(self.directory, name + '.tb')
+            table = None
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if table[:len(MAGIC)] != MAGIC or len(table) != len(MAGIC) + SIZE:
+                    table.close(); table = None
+            self._tables[name] = table
+        return self._tables[name]
+
+    def available(self):
+        return [name for name in MATERIAL if self._table(name) is not None]
+
+    def probe(self, board):
+        # ('win'|'loss'|'draw', plies to mate) for the side to move, or None if not covered
+        lists = board.piece_lists
+        white, black = lists[WHITE], lists[BLACK]
+        if len(white) + len(black) == 2 and board.king_sq[WHITE] is not None and board.king_sq[BLACK] is not None:
+            return 'draw', 0
+        if len(white) + len(black) != 3: return None
+        if len(white) == 2:
+            x, piece = next((sq, p) for sq, p in white.items() if p != 'K')
+            wk, bk, stm_white = board.king_sq[WHITE], board.king_sq[BLACK], board.turn == WHITE
+        else:
+            # colour-flip: Black's piece becomes White's on the mirrored square
+            x, piece = next((sq, p) for sq, p in black.items() if p != 'k')
+            x ^= 56; piece = piece.upper()
+            wk, bk, stm_white = board.king_sq[BLACK] ^ 56, board.king_sq[WHITE] ^ 56, board.turn == BLACK
+        if piece in 'BN': return 'draw', 0
+        table = self._table('K' + piece + 'K')
+        if table is None: return None
+        value = table[len(MAGIC) + index(stm_white, *canonical(wk, bk, x, piece == 'P'))]
+        if value == INVALID: return None
+        return decode(value)
+
+    def best_move(self, board):
+        # Move that keeps the best result with the quickest mate (or longest defence), or None
+        here = self.probe(board)
+        if here is None: return None
+        best = None; best_key = None
+        for code in board.legal_codes():
+            board.make_code(code)
+            r = self.probe(board)
+            board.unmake_code()
+            if r is None: continue
+            result, plies = r
+            # rank successors from the opponent's point of view: their loss first (fast), then draw, then their win (slow)
+            key = (0, plies) if result == 'loss' else (1, 0) if result == 'draw' else (2, -plies)
+            if best_key is None or key < best_key:
+                best, best_key = code, key
+        return board.decode_move(best) if best is not None else None
+
+    def close(self):
+        for table in self._tables.values():
+            if table is not None: table.close()
+        self._tables = {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe 3-man endgame tablebases")
+    sub = parser.add_subparsers(dest='command', required=True)
+    gen = sub.add_parser('generate')
+    gen.add_argument('tables', nargs='*', help=f"tables to build (default: all of {', '.join(MATERIAL)})")
+    gen.add_argument('-d', '--directory', default=TABLEBASE_DIR)
+    probe = sub.add_parser('probe')
+    probe.add_argument('--fen', required=True)
+    probe.add_argument('-d', '--directory', default=TABLEBASE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        # choices= is not used: with nargs='*' argparse checks the whole (empty) list against it
+        unknown = [name for name in args.tables if name not in MATERIAL]
+        if unknown: gen.error(f"unknown table {', '.join(unknown)} (choose from {', '.join(MATERIAL)})")
+        for name in MATERIAL:
+            if not args.tables or name in args.tables: generate(name, args.directory)
+    else:
+        board = Board(args.fen)
+        tb = Tablebases(args.directory)
+        r = tb.probe(board)
+        if r is None:
+            print("not in the tablebases")
+        else:
+            move = tb.best_move(board)
+            print(f"{r[0]} (mate in {r[1]} plies)" if r[0] != 'draw' else "draw", f"best move {move.uci()}" if move else "")
+
+if __name__ == "__main__":
+    main()
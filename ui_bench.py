@@ -0,0 +1,136 @@
+# ui_bench.py - headless benchmark of the pygame UI (SDL dummy video driver, no display needed)
+#
+#   python ui_bench.py                              # random 80-ply PvP game, replayed as clicks
+#   python ui_bench.py --moves "e2e4 e7e5 d1h5"     # or a move list / --moves-file games.txt
+#   python ui_bench.py --clicks "e2 e4 e7 e5"       # or raw square clicks
+#   python ui_bench.py --full --max-p99 20          # redraw everything each frame, fail if p99 > 20 ms
+#
+# Every scripted click is one frame: ChessMain.handle_click + check_game_over (input and engine work)
+# followed by ChessMain.draw (rendering into the off-screen display). Promotions go through the real
+# popup: the piece choice is queued as a click before the move's target square is clicked.
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import main
+from engine import Board
+
+main.GAMES_PGN = None   # don't append benchmark games to the player's game file
+
+def square_center(name):
+    c = ord(name[0]) - ord('a'); r = 8 - int(name[1])
+    return (c * main.SQ_SIZE + main.SQ_SIZE // 2, r * main.SQ_SIZE + main.SQ_SIZE // 2)
+
+def promotion_choice_pos(piece):
+    # centre of the piece's box in ChessMain.show_promotion_popup
+    popup_x = (main.WIDTH - 4 * main.SQ_SIZE) // 2
+    popup_y = (main.HEIGHT - main.SQ_SIZE) // 2
+    return (popup_x + 'QRBN'.index(piece.upper()) * main.SQ_SIZE + main.SQ_SIZE // 2, popup_y + main.SQ_SIZE // 2)
+
+def moves_to_clicks(moves):
+    # [(square, promotion piece or None)]: two clicks per uci move
+    clicks = []
+    for uci in moves:
+        clicks.append((uci[:2], None))
+        clicks.append((uci[2:4], uci[4:5] or None))
+    return clicks
+
+def random_game(plies, seed):
+    rng = random.Random(seed)
+    board = Board()
+    moves = []
+    while len(moves) < plies and board.game_status() is None:
+        move = rng.choice(board.get_valid_moves())
+        moves.append(move.uci())
+        board.apply_move(move)
+    return moves
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': ordered[-1] * 1000,
+            'mean': sum(ordered) / len(ordered) * 1000}
+
+def run(clicks, full=False, idle_frames=0):
+    game = main.ChessMain()
+    game.new_game("PvP")
+    game.check_game_over()
+    game.draw()
+    engine_t, draw_t, total_t = [], [], []
+
+    def frame(pos=None):
+        t0 = time.perf_counter()
+        if pos is not None: game.handle_click(pos)
+        game.check_game_over()
+        t1 = time.perf_counter()
+        if full: game.invalidate()
+        game.draw()
+        t2 = time.perf_counter()
+        engine_t.append(t1 - t0); draw_t.append(t2 - t1); total_t.append(t2 - t0)
+
+    for square, promo in clicks:
+        if promo:
+            # the popup waits for this click with pygame.event.wait
+            pos = promotion_choice_pos(promo)
+            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+        frame(square_center(square))
+        for _ in range(idle_frames): frame()
+    game.ai.shutdown()
+    return game, engine_t, draw_t, total_t
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Headless UI frame-time benchmark")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--moves', help="space separated uci moves, played by clicking")
+    source.add_argument('--moves-file', help="file of uci moves (whitespace separated)")
+    source.add_argument('--clicks', help="space separated squares to click, e.g. 'e2 e4'")
+    parser.add_argument('--plies', type=int, default=80, help="length of the random game when no script is given")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="replay the script this many times")
+    parser.add_argument('--idle', type=int, default=0, help="extra frames without input after each click")
+    parser.add_argument('--full', action='store_true', help="invalidate before every frame (worst case redraw)")
+    parser.add_argument('--json', help="also write the statistics to this file")
+    parser.add_argument('--max-p99', type=float, help="exit with status 1 if the p99 frame time (ms) is above this")
+    args = parser.parse_args(argv)
+
+    if args.clicks:
+        clicks = [(sq, None) for sq in args.clicks.split()]
+    else:
+        if args.moves: moves = args.moves.split()
+        elif args.moves_file:
+            with open(args.moves_file) as f: moves = f.read().split()
+        else: moves = random_game(args.plies, args.seed)
+        clicks = moves_to_clicks(moves)
+
+    engine_t, draw_t, total_t = [], [], []
+    for _ in range(args.repeat):
+        with contextlib.redirect_stdout(io.StringIO()):   # the UI prints every move
+            game, e, d, t = run(clicks, args.full, args.idle)
+        engine_t += e; draw_t += d; total_t += t
+    stats = {'frames': len(total_t), 'plies': len(game.gs.move_stack), 'result': game.game_over_text,
+             'total_ms': percentiles(total_t), 'engine_ms': percentiles(engine_t), 'draw_ms': percentiles(draw_t),
+             'engine_share': sum(engine_t) / max(sum(total_t), 1e-12)}
+
+    print(f"{stats['frames']} frames, {stats['plies']} plies on the board at the end"
+          + (f" ({stats['result']})" if stats['result'] else ""))
+    for name in ('total', 'engine', 'draw'):
+        p = stats[name + '_ms']
+        print(f"{name:<7} p50 {p['p50']:7.3f}  p90 {p['p90']:7.3f}  p99 {p['p99']:7.3f}  max {p['max']:7.3f}  mean {p['mean']:7.3f} ms")
+    print(f"engine/input share of frame time: {100 * stats['engine_share']:.1f}%")
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(stats, f, indent=2)
+    if args.max_p99 is not None and stats['total_ms']['p99'] > args.max_p99:
+        print(f"FAIL: p99 {stats['total_ms']['p99']:.3f} ms > {args.max_p99} ms")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())